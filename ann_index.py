@@ -0,0 +1,127 @@
+import hashlib
+import numpy as np
+
+# Assignment is done in blocks so building over 1M+ users never needs
+# a full (users x lists) score matrix in memory
+_BLOCK = 65536
+
+
+def _assign(mat, centroids):
+    labels = np.empty(len(mat), dtype=np.int32)
+    for start in range(0, len(mat), _BLOCK):
+        block = mat[start:start + _BLOCK]
+        labels[start:start + _BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _kmeans(mat, nlist, iters, rng):
+    """Spherical k-means (cosine) on a training sample of the gallery"""
+    sample = mat
+    if len(mat) > nlist * 256:
+        sample = mat[rng.choice(len(mat), nlist * 256, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        nrm = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = nrm[:, 0] == 0
+        # Re-seed empty lists from random points so no list goes unused
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        nrm[empty] = 1.0
+        centroids = (sums / nrm).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file ANN index over unit-norm ArcFace embeddings.
+
+    Embeddings are clustered into `nlist` cells; a query only scans the
+    `nprobe` cells whose centroids are closest. Raising `nprobe` trades
+    latency for recall (nprobe == nlist is exact search).
+    """
+
+    def __init__(self, rolls, centroids, vecs, ids, offsets, nprobe=8, checksum=""):
+        self.rolls = list(rolls)
+        self.centroids = centroids
+        self.vecs = vecs        # gallery rows, grouped by cell
+        self.ids = ids          # row -> index into rolls
+        self.offsets = offsets  # cell c owns rows offsets[c]:offsets[c+1]
+        self.nprobe = nprobe
+        self.checksum = checksum  # matrix_checksum() of the gallery it was built from
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.rolls)
+
+    @classmethod
+    def build(cls, rolls, mat, nlist=None, nprobe=8, iters=10, seed=0):
+        mat = np.ascontiguousarray(mat, dtype=np.float32)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(len(mat)))
+        nlist = max(1, min(nlist, len(mat)))
+        rng = np.random.default_rng(seed)
+        centroids = _kmeans(mat, nlist, iters, rng)
+        labels = _assign(mat, centroids)
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        return cls(rolls, centroids, mat[order], order, offsets, nprobe, matrix_checksum(mat))
+
+    def search(self, queries, k=1, nprobe=None):
+        """Top-k (roll, score) per query embedding, best first"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        coarse = queries @ self.centroids.T
+        cells = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for q, qcells in zip(queries, cells):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in qcells])
+            if len(rows) == 0:
+                results.append([])
+                continue
+            scores = self.vecs[rows] @ q
+            kk = min(k, len(rows))
+            top = np.argpartition(-scores, kk - 1)[:kk]
+            top = top[np.argsort(-scores[top])]
+            results.append([(self.rolls[self.ids[rows[j]]], float(scores[j])) for j in top])
+        return results
+
+    def save(self, path):
+        np.savez(path, rolls=np.asarray(self.rolls, dtype=str), centroids=self.centroids,
+                 vecs=self.vecs, ids=self.ids, offsets=self.offsets, nprobe=self.nprobe,
+                 checksum=self.checksum)
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        with np.load(path) as data:
+            return cls([str(r) for r in data["rolls"]], data["centroids"], data["vecs"],
+                       data["ids"], data["offsets"],
+                       nprobe if nprobe is not None else int(data["nprobe"]),
+                       str(data["checksum"]) if "checksum" in data else "")
+
+
+def matrix_checksum(mat):
+    return hashlib.blake2b(np.ascontiguousarray(mat, dtype=np.float32).tobytes(), digest_size=16).hexdigest()
+
+
+def load_or_build(path, rolls, mat, nlist=None, nprobe=8):
+    """Load the index saved at `path`, rebuilding it if any roll or embedding changed"""
+    try:
+        index = IVFIndex.load(path, nprobe)
+        if (index.rolls == list(rolls) and index.dim == mat.shape[1]
+                and index.checksum == matrix_checksum(mat)):
+            return index
+    except (OSError, KeyError, ValueError):
+        pass
+    index = IVFIndex.build(rolls, mat, nlist=nlist, nprobe=nprobe)
+    index.save(path)
+    return index
@@ -1,60 +1,145 @@
+# Imported first: its import time stands in for process start
+from startup import Deferred, since_start
 import cv2
-import numpy as np
+import threading
+import time
 import tkinter as tk
 from PIL import Image, ImageTk
-from datetime import datetime
 import firebase_admin
 from firebase_admin import credentials, db
-from insightface.app import FaceAnalysis
+from face_models import create_face_analyser, get_faces, AdaptiveDetector
+from gallery import Gallery, parse_user, match_faces
+from pipeline import FramePipeline
+from tracking import FaceTracker
+from gallery_store import GalleryStore, FirebaseBackend
+from attendance_writer import AttendanceWriter
+from attendance_store import AttendanceStore
+from ann_index import load_or_build
+from metrics import Metrics
+from tk_display import FrameView
+from auto_mark import AutoMarker, today
+from last_seen import LastSeen
 
-# Initialize InsightFace with GPU preference (falls back to CPU automatically)
-face_analyser = FaceAnalysis(
-    name="buffalo_l",
-    providers=['CUDAExecutionProvider', 'CPUExecutionProvider']
-)
-face_analyser.prepare(ctx_id=0, det_size=(640, 640))
+MATCH_THRESHOLD = 0.45
 
-# Firebase setup - Replace with your own credentials
-cred = credentials.Certificate("YOUR_SERVICE_ACCOUNT_KEY.json")
-firebase_admin.initialize_app(cred, {
-    "databaseURL": "https://YOUR-PROJECT-ID-default-rtdb.firebaseio.com/"
-})
+# Local gallery cache (memory-mapped embeddings) that syncs only changed
+# users; set GALLERY_CACHE_DIR = None to download all of `users` at startup
+GALLERY_CACHE_DIR = "gallery_cache"
+SYNC_INTERVAL = 60  # seconds
+
+# "Last" attendance is read per recognized user (users/{roll}/last_seen),
+# never with the gallery; this many recent lookups are kept in memory
+LAST_SEEN_CACHE = 256
+
+# Marks are journaled here and written to Firebase in the background
+ATTENDANCE_JOURNAL = "attendance_journal.jsonl"
+# Local SQLite copy of attendance for reports (attendance_report.py);
+# None to disable
+ATTENDANCE_DB = "attendance.db"
+
+# Approximate search for very large galleries, off by default: a missed
+# cell shows an enrolled student as "Unknown". Set ANN_MIN_USERS (e.g.
+# 50000) to use it from that size on, and check ANN_NPROBE with
+# bench_ann.py first - 64 gives recall@1 of 0.99 at 20k users there.
+ANN_INDEX_PATH = "gallery_ivf.npz"
+ANN_MIN_USERS = None
+ANN_NPROBE = 64
+
+# In-memory gallery precision: "float32", "float16" (half the memory) or
+# "int8" (a quarter); see bench_quantization.py for the accuracy cost
+GALLERY_PRECISION = "float32"
+
+# Tracking mode: full detection + embedding only every DETECT_EVERY frames
+# (or when a track is lost); boxes follow optical flow in between and each
+# label is the vote over the track's last VOTE_WINDOW recognitions
+TRACKING = True
+DETECT_EVERY = 5
+VOTE_WINDOW = 7
+
+# Adaptive detection: scan only a padded box around the last faces, at a
+# det_size matched to their size, with a full-frame scan every
+# FULL_SCAN_EVERY detections for newcomers at least MIN_FACE_PX wide
+ADAPTIVE_DETECTION = True
+FULL_SCAN_EVERY = 10
+MIN_FACE_PX = 80
+
+# Hands-free marking: a roll is marked once it is recognized in at least
+# AUTO_MARK_VOTES of the last AUTO_MARK_FRAMES recognitions. Each roll is
+# marked at most once a day; after a mark nobody is marked for
+# AUTO_MARK_COOLDOWN seconds. The button still works for manual marks.
+AUTO_MARK = True
+AUTO_MARK_FRAMES = 5
+AUTO_MARK_VOTES = 4
+AUTO_MARK_COOLDOWN = 1.0  # seconds
+# Auto-mark waits until today's marks from all kiosks (attendance_days) have
+# been read; a failed read is retried this often
+DAY_INDEX_RETRY = 10  # seconds
+# The index is re-read this often, adding other kiosks' marks to the dedup
+# index and the local attendance store
+DAY_INDEX_REFRESH = 300  # seconds
+
+# Per-stage timing: optional on-frame FPS/latency overlay and a periodic
+# export (.prom for the node_exporter textfile collector, or .json)
+METRICS_OVERLAY = False
+METRICS_EXPORT_PATH = "metrics_detect.prom"
+METRICS_INTERVAL = 15  # seconds
+
+# Preview refresh cap, independent of the recognition rate
+DISPLAY_FPS = 30
+
+# ONNX Runtime settings: None asks for CUDA first (CPU fallback, default
+# session options); face_models.CPU_PROFILE, or a copy tuned with bench_inference.py,
+# for CPU-only kiosks. Use the same recognition model on both apps.
+INFERENCE_PROFILE = None
+
+def init_firebase():
+    # Firebase setup - Replace with your own credentials
+    cred = credentials.Certificate("YOUR_SERVICE_ACCOUNT_KEY.json")
+    firebase_admin.initialize_app(cred, {
+        "databaseURL": "https://YOUR-PROJECT-ID-default-rtdb.firebaseio.com/"
+    })
+    return db
+
+# InsightFace (detection + recognition only) and Firebase initialize in the
+# background while the window comes up; .get() waits until they are ready
+face_analyser = Deferred(lambda: create_face_analyser(det_size=(640, 640), profile=INFERENCE_PROFILE))
+firebase = Deferred(init_firebase)
 
 def load_users():
-    raw = db.reference("users").get() or {}
-    users = {}
-    # Robustly parse both dict and list outputs
-    if isinstance(raw, dict):
-        iterable = raw.items()
-    elif isinstance(raw, list):
-        # list may contain None if there are firebase "gaps"
-        iterable = ((str(u.get('roll')) if u else '', u) for u in raw if isinstance(u, dict))
-    else:
-        iterable = []
-    for roll, data in iterable:
-        if not isinstance(data, dict): continue
-        emb = np.asarray(data.get("embedding", []), dtype=np.float32)
-        emb_norm = emb / np.linalg.norm(emb) if np.linalg.norm(emb) > 0 else emb
-        users[str(roll)] = {
-            "name": data.get("name", ""),
-            "roll": str(data.get("roll", roll)),
-            "year": data.get("year", ""),
-            "emb_norm": emb_norm,
-            "hist": data.get("attendance_history", [])
-        }
-    return users
-
-def write_attendance(roll):
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    ref = db.reference(f"users/{roll}/attendance_history")
-    hist = ref.get() or []
-    hist.append(ts)
-    ref.set(hist)
-    return ts
+    # gallery/ holds only what matching needs, not attendance history
+    return {roll: parse_user(roll, data) for roll, data in FirebaseBackend(db).fetch_all().items()}
+
+def attach_index(gallery):
+    if ANN_MIN_USERS is None or len(gallery) < ANN_MIN_USERS:
+        return
+    rolls, mat = gallery.largest_group()
+    gallery.index = load_or_build(ANN_INDEX_PATH, rolls, mat, nprobe=ANN_NPROBE)
 
 class App:
     def __init__(self):
-        self.users = load_users()
+        self.closing = threading.Event()
+        self.metrics = Metrics(labels={"app": "detect"})
+        self.metrics.start_export(METRICS_EXPORT_PATH, METRICS_INTERVAL)
+        self.attendance = AttendanceStore(ATTENDANCE_DB) if ATTENDANCE_DB else None
+        self.writer = AttendanceWriter(db, ATTENDANCE_JOURNAL, metrics=self.metrics, ready=firebase,
+                                       on_mark=self.attendance.add_mark if self.attendance else None)
+        # Rolls marked today, so duplicates never reach the database
+        self.auto = AutoMarker(self.auto_mark, AUTO_MARK_FRAMES, AUTO_MARK_VOTES, AUTO_MARK_COOLDOWN)
+        self.auto.seed(e["roll"] for e in self.writer.pending_marks() if e["ts"].startswith(today()))
+        if self.attendance:
+            # Marks already acknowledged have left the journal but not the local store
+            self.auto.seed((row[0] for row in self.attendance.present(today())), today())
+        self.seeded_day = None  # day whose attendance_days index has been read
+        self.last_seen = LastSeen(db, LAST_SEEN_CACHE, ready=firebase)
+        for e in self.writer.pending_marks():
+            self.last_seen.set(e["roll"], e["ts"])
+        self.store = None
+        self.users, self.gallery = {}, Gallery({})
+        self.gallery_ready = threading.Event()
+        self.first_recognition = None
+        self.detector = None
+        threading.Thread(target=self.load_gallery, daemon=True).start()
+        threading.Thread(target=self.seed_days, daemon=True).start()
         self.current_roll = None  # Currently recognized user's roll
 
         # ---- GUI ----
@@ -67,6 +152,7 @@ class App:
         tk.Label(lf, text="Camera", bg="black", fg="white", font=("Helvetica", 14, "bold")).pack()
         self.video_lbl = tk.Label(lf, bg="gray")
         self.video_lbl.pack(fill=tk.BOTH, expand=True)
+        self.view = FrameView(self.video_lbl, self.metrics, DISPLAY_FPS)
 
         rf = tk.Frame(self.root, width=280, bg="#F5F5F5")
         rf.pack(side=tk.RIGHT, fill=tk.Y, padx=8, pady=8)
@@ -103,7 +189,7 @@ class App:
                                   state="disabled", command=self.do_mark)
         self.mark_btn.pack(pady=12, fill=tk.X, padx=25)
 
-        self.statusVar = tk.StringVar(value="Waiting for face…")
+        self.statusVar = tk.StringVar(value="Loading models…")
         tk.Label(rf, textvariable=self.statusVar, bg="#F5F5F5",
                  fg="red", font=("Arial", 11, "bold")).pack(pady=4)
 
@@ -111,47 +197,158 @@ class App:
         self.cam.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
         self.cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
+        # Capture and recognition run on worker threads; Tk only displays
+        self.tracker = FaceTracker(DETECT_EVERY, vote_window=VOTE_WINDOW)
+        infer = self.track if TRACKING else self.recognize
+        self.pipeline = FramePipeline(self.cam, infer, self.metrics).start()
+        self.frame_seq = self.result_seq = 0
+
         self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.after_idle(self.report_window)
         self.update()
         self.root.mainloop()
 
+    def report_window(self):
+        self.metrics.record("time_to_window", since_start())
+        print(f"Window up after {since_start():.2f}s")
+
+    def load_gallery(self):
+        """Background thread: local cache first, then the database"""
+        try:
+            if GALLERY_CACHE_DIR:
+                self.store = GalleryStore(GALLERY_CACHE_DIR, FirebaseBackend(db))
+                if self.store.load():
+                    self.set_gallery(self.store.users(), self.store.gallery())
+                firebase.get()
+                self.sync_gallery()
+            else:
+                firebase.get()
+                with self.metrics.time("firebase_load"):
+                    users = load_users()
+                self.set_gallery(users, Gallery(users))
+        except Exception as e:
+            print(f"Gallery load error: {e}")
+
+    def seed_marked(self):
+        """Add rolls any kiosk marked today (attendance_days index) to the dedup index"""
+        day = today()
+        try:
+            with self.metrics.time("firebase_day_index"):
+                marks = db.reference(f"attendance_days/{day}").get(shallow=True) or {}
+            self.auto.seed(marks, day)
+            if self.attendance:
+                self.attendance.import_day(day, marks)
+        except Exception as e:
+            print(f"Could not load today's attendance: {e}")
+            return False
+        self.seeded_day = day
+        return True
+
+    def seed_days(self):
+        """Background thread: read the day's index, retrying until it succeeds
+        and refreshing it every DAY_INDEX_REFRESH seconds"""
+        firebase.wait()
+        last_read = 0.0
+        while True:
+            if self.seeded_day != today() or time.monotonic() - last_read >= DAY_INDEX_REFRESH:
+                if self.seed_marked():
+                    last_read = time.monotonic()
+            if self.closing.wait(DAY_INDEX_RETRY):
+                return
+
+    def set_gallery(self, users, gallery):
+        attach_index(gallery)
+        gallery.quantize(GALLERY_PRECISION)
+        # The gallery owns the embeddings; only names and details are kept here.
+        # Entries of removed users stay so in-flight results still resolve
+        users = {roll: {k: v for k, v in u.items() if k != "emb_norm"} for roll, u in users.items()}
+        self.users = dict(self.users, **users)
+        if self.attendance:
+            self.attendance.upsert_students(users)
+        self.gallery = gallery
+        self.gallery_ready.set()
+
+    def sync_gallery(self):
+        """Pull gallery changes every SYNC_INTERVAL and swap them in"""
+        while True:
+            try:
+                with self.metrics.time("firebase_sync"):
+                    changed = self.store.sync()
+                if changed or not self.gallery_ready.is_set():
+                    self.set_gallery(self.store.users(), self.store.gallery())
+            except Exception as e:
+                print(f"Gallery sync error: {e}")
+            if self.closing.wait(SYNC_INTERVAL):
+                return
+
     def update(self):
-        ok, frame = self.cam.read()
-        if ok:
-            self.recognize(frame.copy())
-            self.show(frame)
-        self.root.after(30, self.update)
+        seq, frame = self.pipeline.frames.peek()
+        if seq != self.frame_seq and self.view.due():
+            self.frame_seq = seq
+            # Boxes and labels come from the most recent completed inference
+            res_seq, matches = self.pipeline.results.peek()
+            if res_seq != self.result_seq:
+                self.result_seq = res_seq
+                self.show_details(matches)
+            frame = self.view.scratch(frame)
+            self.draw(frame, matches or [])
+            if METRICS_OVERLAY:
+                self.metrics.overlay(frame)
+            self.view.show(frame)
+        self.root.after(10, self.update)
 
     def recognize(self, frame):
-        faces = face_analyser.get(frame)
-        best_roll, best_sim = None, 0.45
-
-        for f in faces:
-            emb = f.embedding.astype(np.float32)
-            nrm = np.linalg.norm(emb)
-            if nrm == 0: continue
-            emb /= nrm
-            for roll, data in self.users.items():
-                sim = np.dot(emb, data["emb_norm"]) if len(emb) == len(data["emb_norm"]) else 0
-                if sim > best_sim:
-                    best_sim, best_roll = sim, roll
-            x1, y1, x2, y2 = f.bbox.astype(int)
-            clr = (0, 255, 0) if best_roll else (0, 0, 255)
+        """Runs on the inference thread: [(bbox, roll, sim)] per face"""
+        analyser = face_analyser.get()
+        self.gallery_ready.wait()
+        if ADAPTIVE_DETECTION and self.detector is None:
+            self.detector = AdaptiveDetector(analyser.det_model, FULL_SCAN_EVERY, min_face=MIN_FACE_PX)
+        faces = get_faces(analyser, frame, self.metrics, detector=self.detector)
+        with self.metrics.time("match"):
+            matches = match_faces(faces, self.gallery, MATCH_THRESHOLD)
+        if AUTO_MARK and self.seeded_day == today():
+            # Fresh recognitions only: frames moved by the tracker do not vote
+            self.auto.update(matches)
+        if self.first_recognition is None:
+            self.first_recognition = since_start()
+            self.metrics.record("time_to_first_recognition", self.first_recognition)
+            print(f"First recognition after {self.first_recognition:.2f}s "
+                  f"(models {face_analyser.seconds:.2f}s)")
+        return matches
+
+    def track(self, frame):
+        """Runs on the inference thread: tracked (bbox, roll, sim) per face"""
+        return self.tracker.update(frame, self.recognize)
+
+    def draw(self, frame, matches):
+        for (x1, y1, x2, y2), roll, _ in matches:
+            clr = (0, 255, 0) if roll else (0, 0, 255)
             # Only show name, not confidence
             cv2.rectangle(frame, (x1, y1), (x2, y2), clr, 2)
-            cv2.putText(frame, f"{self.users[best_roll]['name']}" if best_roll else "Unknown",
+            cv2.putText(frame, f"{self.users[roll]['name']}" if roll else "Unknown",
                         (x1, y1 - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.6, clr, 2)
 
+    def show_details(self, matches):
+        best_roll, best_sim = None, MATCH_THRESHOLD
+        for _, roll, sim in matches:
+            if roll and sim > best_sim:
+                best_sim, best_roll = sim, roll
+
         if best_roll:
             usr = self.users[best_roll]
             self.nameVar.set(usr["name"])
             self.rollVar.set(usr["roll"])
             self.yearVar.set(usr["year"])
-            last = usr["hist"][-1] if usr["hist"] else "—"
-            self.lastVar.set(last)
+            last = self.last_seen.get(best_roll)
+            self.lastVar.set("…" if last is None else last or "—")
             self.current_roll = best_roll
-            self.mark_btn.config(state="normal")
-            self.statusVar.set("Recognized • click button to mark")
+            if self.auto.is_marked(best_roll):
+                self.mark_btn.config(state="disabled")
+                self.statusVar.set("Attendance recorded ✔")
+            else:
+                self.mark_btn.config(state="normal")
+                self.statusVar.set("Recognized • hold still" if AUTO_MARK and self.seeded_day == today() else
+                                   "Recognized • click button to mark")
         else:
             self.clear_details()
 
@@ -163,33 +360,38 @@ class App:
         self.lastVar.set("—")
         self.statusVar.set("Waiting for face…")
 
+    def auto_mark(self, roll):
+        """Called on the inference thread when AutoMarker confirms a roll"""
+        ts = self.writer.mark(roll)
+        self.last_seen.set(roll, ts)
+        return ts
+
     def do_mark(self):
         if self.current_roll:
-            ts = write_attendance(self.current_roll)
-            self.users[self.current_roll]["hist"].append(ts)
+            if self.auto.is_marked(self.current_roll):
+                self.statusVar.set("Already marked today")
+                self.mark_btn.config(state="disabled")
+                return
+            # Journaled and queued - the database write happens off the Tk thread
+            ts = self.writer.mark(self.current_roll)
+            self.auto.seed([self.current_roll])
+            self.last_seen.set(self.current_roll, ts)
             self.lastVar.set(ts)
             self.statusVar.set("Attendance recorded ✔")
             self.mark_btn.config(state="disabled")
 
-    def show(self, frame):
-        h, w = frame.shape[:2]
-        self.root.update_idletasks()
-        label_w, label_h = self.video_lbl.winfo_width(), self.video_lbl.winfo_height()
-        if label_w > 1 and label_h > 1:
-            scale = min(label_w / w, label_h / h)
-            new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
-            frame = cv2.resize(frame, (new_w, new_h))
-        else:
-            frame = cv2.resize(frame, (640, 480))
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        imgtk = ImageTk.PhotoImage(Image.fromarray(rgb))
-        self.video_lbl.imgtk = imgtk
-        self.video_lbl.configure(image=imgtk)
-
     def close(self):
+        self.closing.set()
+        self.writer.stop()
+        self.pipeline.stop()
+        self.metrics.stop_export()
+        if self.attendance:
+            self.attendance.close()
         if self.cam.isOpened():
             self.cam.release()
         self.root.destroy()
 
 if __name__ == "__main__":
+    face_analyser.start()
+    firebase.start()
     App()
@@ -1,32 +1,81 @@
+# Imported first: its import time stands in for process start
+from startup import Deferred, since_start
 import cv2
-import numpy as np
+import queue
+import time
 import tkinter as tk
 from tkinter import messagebox
 from PIL import Image, ImageTk
 import firebase_admin
 from firebase_admin import credentials, db
-from insightface.app import FaceAnalysis
-
-# Initialize InsightFace
-face_analyzer = FaceAnalysis(name="buffalo_l",
-                             providers=['CUDAExecutionProvider','CPUExecutionProvider'])
-face_analyzer.prepare(ctx_id=0, det_size=(640,640))
-
-# Firebase setup - Replace with your own credentials
-cred = credentials.Certificate("YOUR_SERVICE_ACCOUNT_KEY.json")
-firebase_admin.initialize_app(cred, {
-    'databaseURL': "https://YOUR-PROJECT-ID-default-rtdb.firebaseio.com/"
-})
+from face_models import create_face_analyser, get_faces
+from face_quality import check_capture
+from pipeline import FramePipeline
+from gallery import mean_embedding, user_record, registration_updates
+from metrics import Metrics
+from tk_display import FrameView
 
 instructions = [
     "Look straight", "Turn slightly left", "Turn slightly right",
     "Look slightly up", "Look slightly down", "Smile"
 ]
 IMGS_PER_ANGLE = 3
+# face_quality.POSES entry each instruction is checked against
+POSES = ["straight", "left", "right", "up", "down", "straight"]
+
+# Captures reuse the newest preview detection (and its embedding) if it is
+# at most this old, instead of running the models again
+DETECTION_MAX_AGE = 0.5  # seconds
+
+# Auto capture: accept frames on the inference thread as soon as exactly one
+# face is big enough, sharp enough and in the requested pose
+AUTO_CAPTURE = True
+AUTO_CAPTURE_GAP = 0.3   # seconds between accepted frames
+MIN_FACE_PX = 100
+MIN_SHARPNESS = 60.0     # variance of the Laplacian over the face
+
+# How the embedding is stored: "list" (JSON floats, ~10 KB - the original
+# format), "f16" (base64 float16, ~1.4 KB) or "i8" (base64 int8 + scale,
+# ~0.7 KB). Current kiosks read all three, older kiosks only "list" - switch
+# once every kiosk is updated.
+EMBEDDING_FORMAT = "list"
+
+# Per-stage timing: optional on-frame FPS/latency overlay and a periodic
+# export (.prom for the node_exporter textfile collector, or .json)
+METRICS_OVERLAY = False
+METRICS_EXPORT_PATH = "metrics_register.prom"
+METRICS_INTERVAL = 15  # seconds
+
+# Preview refresh cap, independent of the detection rate
+DISPLAY_FPS = 30
+
+# ONNX Runtime settings: None asks for CUDA first (CPU fallback, default
+# session options); face_models.CPU_PROFILE, or a copy tuned with bench_inference.py,
+# for CPU-only kiosks. Use the same recognition model on both apps.
+INFERENCE_PROFILE = None
+
+def init_firebase():
+    # Firebase setup - Replace with your own credentials
+    cred = credentials.Certificate("YOUR_SERVICE_ACCOUNT_KEY.json")
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': "https://YOUR-PROJECT-ID-default-rtdb.firebaseio.com/"
+    })
+    return db
+
+# InsightFace (detection + recognition only) and Firebase initialize in the
+# background while the window comes up; .get() waits until they are ready
+face_analyzer = Deferred(lambda: create_face_analyser(det_size=(640, 640), profile=INFERENCE_PROFILE))
+firebase = Deferred(init_firebase)
 
 class RegistrationApp:
     def __init__(self):
+        self.session = 0
+        self.accepted = queue.Queue()  # (session, step, embedding) from auto capture
+        self.auto_capture = AUTO_CAPTURE
+        self.captured_seq = None  # pipeline result used by the last manual capture
         self.reset_state()
+        self.metrics = Metrics(labels={"app": "register"})
+        self.metrics.start_export(METRICS_EXPORT_PATH, METRICS_INTERVAL)
         
         # Camera setup
         self.cap = cv2.VideoCapture(0)
@@ -54,6 +103,7 @@ class RegistrationApp:
         # Video label
         self.video_label = tk.Label(left_frame, bg="gray")
         self.video_label.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
+        self.view = FrameView(self.video_label, self.metrics, DISPLAY_FPS)
         
         # Status label
         self.status_var = tk.StringVar(value="Fill details to enable Capture")
@@ -128,6 +178,10 @@ class RegistrationApp:
                                  state="disabled", command=self.finish_user)
         self.next_btn.pack(pady=3, fill=tk.X)
 
+        self.auto_var = tk.BooleanVar(value=AUTO_CAPTURE)
+        tk.Checkbutton(btn_frame, text="Auto capture", variable=self.auto_var,
+                       font=("Helvetica", 10), command=self.toggle_auto).pack(pady=3)
+
         # Simplified instructions
         instructions_text = """📷 Instructions:
 • Your full face should be visible
@@ -142,7 +196,12 @@ class RegistrationApp:
         for var in (self.name_var, self.roll_var, self.year_var):
             var.trace_add("write", self.update_capture_state)
         
+        # Capture and detection run on worker threads; Tk only displays
+        self.pipeline = FramePipeline(self.cap, self.detect, self.metrics).start()
+        self.frame_seq = 0
+
         self.window.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.window.after_idle(lambda: print(f"Window up after {since_start():.2f}s"))
         self.update_frame()
         self.window.mainloop()
 
@@ -151,6 +210,8 @@ class RegistrationApp:
         self.step = 0
         self.count = 0
         self.embs = []
+        self.last_auto = 0.0
+        self.started = 0.0
 
     def update_capture_state(self, *_):
         """Enable capture button only when all details are filled"""
@@ -164,55 +225,68 @@ class RegistrationApp:
             self.capture_btn.config(state="disabled")
             self.status_var.set("Fill all details to enable Capture")
 
+    def toggle_auto(self):
+        self.auto_capture = self.auto_var.get()
+
+    def detect(self, frame):
+        """Runs on the inference thread; only detects while a pose is being captured.
+
+        Returns (time, faces, reason) where reason is why the frame would not
+        pass the capture gates (None if it would).
+        """
+        session, step = self.session, self.step
+        if not (self.registering and step < len(instructions)):
+            return None
+        faces = get_faces(face_analyzer.get(), frame, self.metrics)
+        with self.metrics.time("capture_gates"):
+            reason = check_capture(frame, faces, POSES[step], MIN_FACE_PX, MIN_SHARPNESS)
+        now = time.monotonic()
+        if self.auto_capture and reason is None and now - self.last_auto >= AUTO_CAPTURE_GAP:
+            self.last_auto = now
+            self.accepted.put((session, step, faces[0].embedding))
+        return now, faces, reason
+
     def update_frame(self):
         """Update camera frame with proper bounds checking"""
-        ret, frame = self.cap.read()
-        if ret:
-            original_height, original_width = frame.shape[:2]
+        # Frames accepted by auto capture; stale ones (older step or user) are dropped
+        while not self.accepted.empty():
+            session, step, emb = self.accepted.get_nowait()
+            if self.registering and session == self.session and step == self.step:
+                self.add_capture(emb)
+
+        seq, frame = self.pipeline.frames.peek()
+        if seq != self.frame_seq and self.view.due():
+            self.frame_seq = seq
+            frame = self.view.scratch(frame)
             
             # Add bounds checking for self.step
             if self.registering and self.step < len(instructions):
                 cv2.putText(frame, f"Step: {instructions[self.step]} ({self.count}/{IMGS_PER_ANGLE})", 
                            (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
                 
-                faces = face_analyzer.get(frame)
-                if faces:
-                    for face in faces:
-                        bbox = face.bbox.astype(int)
-                        cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
+                # Boxes come from the most recent completed detection
+                _, result = self.pipeline.results.peek()
+                faces, reason = (result[1], result[2]) if result else ([], "No face detected")
+                for face in faces:
+                    bbox = face.bbox.astype(int)
+                    cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
+                if reason is None:
                     cv2.putText(frame, "Face Detected", (20, 70), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
                 else:
-                    cv2.putText(frame, "No face detected", (20, 70), 
+                    cv2.putText(frame, reason, (20, 70), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
             elif self.registering and self.step >= len(instructions):
                 # Registration completed, show completion message
                 cv2.putText(frame, "Registration Complete!", (20, 40), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
             
-            # Scale to fit label
-            self.window.update_idletasks()
-            label_width = self.video_label.winfo_width()
-            label_height = self.video_label.winfo_height()
-            
-            if label_width > 1 and label_height > 1:
-                scale_w = label_width / original_width
-                scale_h = label_height / original_height
-                scale = min(scale_w, scale_h)
-                
-                new_width = int(original_width * scale)
-                new_height = int(original_height * scale)
-                
-                display_frame = cv2.resize(frame, (new_width, new_height))
-            else:
-                display_frame = cv2.resize(frame, (640, 480))
-            
-            rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            imgtk = ImageTk.PhotoImage(Image.fromarray(rgb))
-            self.video_label.imgtk = imgtk
-            self.video_label.config(image=imgtk)
+            if METRICS_OVERLAY:
+                self.metrics.overlay(frame)
+
+            self.view.show(frame)
         
-        self.window.after(30, self.update_frame)
+        self.window.after(10, self.update_frame)
 
     def start_registration(self):
         """Validate inputs and start registration process"""
@@ -228,14 +302,22 @@ class RegistrationApp:
             return
             
         try:
-            if db.reference(f'users/{roll}').get():
+            with self.metrics.time("firebase_check"):
+                # shallow: only whether it exists, not the user's whole history
+                exists = firebase.get().reference(f'users/{roll}').get(shallow=True)
+            if exists:
                 messagebox.showerror("Exists", "Roll already registered")
                 return
         except Exception as e:
             print(f"Firebase error: {e}")
         
+        self.session += 1
         self.registering = True
-        self.status_var.set("Registration started - Click Capture when ready")
+        self.started = time.monotonic()
+        if self.auto_capture:
+            self.status_var.set("Registration started - hold each pose, captures are automatic")
+        else:
+            self.status_var.set("Registration started - Click Capture when ready")
         self.reg_btn.config(state="disabled")
         self.capture_btn.config(state="normal")
         self.next_btn.config(state="disabled")
@@ -255,17 +337,26 @@ class RegistrationApp:
             messagebox.showinfo("Complete", "All steps completed!")
             return
             
-        ret, frame = self.cap.read()
-        if not ret:
-            self.status_var.set("Camera error")
+        if not face_analyzer.ready():
+            self.status_var.set("Models still loading - try again in a moment")
             return
-            
-        faces = face_analyzer.get(frame)
-        if not faces:
+        # The preview detection already has the embedding - no second inference
+        seq, result = self.pipeline.results.peek()
+        if result is None or time.monotonic() - result[0] > DETECTION_MAX_AGE:
+            self.status_var.set("Waiting for detection - try again in a moment")
+            return
+        if seq == self.captured_seq:
+            # Each capture must come from a new frame, not the same one again
+            self.status_var.set("Hold still - waiting for a new frame")
+            return
+        if not result[1]:
             self.status_var.set("No face detected - adjust position")
             return
-        
-        self.embs.append(faces[0].embedding)
+        self.captured_seq = seq
+        self.add_capture(result[1][0].embedding)
+
+    def add_capture(self, emb):
+        self.embs.append(emb)
         self.count += 1
         self.status_var.set(f"Captured {self.count}/{IMGS_PER_ANGLE} for: {instructions[self.step]}")
         
@@ -282,17 +373,14 @@ class RegistrationApp:
     def save_registration(self):
         """Save registration data to Firebase"""
         try:
-            emb_mean = np.mean(np.array(self.embs), axis=0).tolist()
-            data = {
-                "name": self.name_var.get().strip(),
-                "roll": self.roll_var.get().strip(),
-                "year": self.year_var.get().strip(),
-                "embedding": emb_mean,
-                "total_attendance": 0,
-                "attendance_history": []
-            }
-            db.reference(f'users/{data["roll"]}').set(data)
-            self.status_var.set("Registration completed successfully!")
+            elapsed = time.monotonic() - self.started
+            self.metrics.record("enrollment", elapsed)
+            data = user_record(self.name_var.get().strip(), self.roll_var.get().strip(),
+                               self.year_var.get().strip(), mean_embedding(self.embs),
+                               EMBEDDING_FORMAT)
+            with self.metrics.time("firebase_save"):
+                firebase.get().reference("/").update(registration_updates([data]))
+            self.status_var.set(f"Registration completed successfully in {elapsed:.1f}s!")
             self.capture_btn.config(state="disabled")
             self.next_btn.config(state="normal")
         except Exception as e:
@@ -318,9 +406,13 @@ class RegistrationApp:
 
     def on_close(self):
         """Clean up and close"""
+        self.pipeline.stop()
+        self.metrics.stop_export()
         if self.cap.isOpened():
             self.cap.release()
         self.window.destroy()
 
 if __name__ == "__main__":
+    face_analyzer.start()
+    firebase.start()
     RegistrationApp()
@@ -0,0 +1,112 @@
+"""Attendance reports from the local store (attendance.db), without Firebase.
+
+    python attendance_report.py day 2024-03-01 --year 2          # who came
+    python attendance_report.py absent 2024-03-01 --out absent.csv
+    python attendance_report.py range 2024-01-08 2024-04-30      # per student %
+    python attendance_report.py years 2024-01-08 2024-04-30      # per year %
+    python attendance_report.py backfill --credentials key.json --database-url URL
+    python attendance_report.py sync --credentials key.json --database-url URL
+
+The kiosk adds its own marks to the store as it happens, and other kiosks'
+marks of the current day from the attendance_days index. `backfill` imports
+everything already in Firebase (attendance_history lists and the per-day
+attendance maps) once; `sync` then keeps a store up to date from the
+attendance_days index alone, from its newest day (or --since) on. Both can
+be re-run safely.
+"""
+import argparse
+import csv
+import sys
+import time
+from attendance_store import AttendanceStore
+
+
+def write_rows(header, rows, out):
+    if out:
+        with open(out, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(header)
+            writer.writerows(rows)
+        print(f"{len(rows)} rows -> {out}", file=sys.stderr)
+        return
+    print("\t".join(header))
+    for row in rows:
+        print("\t".join(str(v) for v in row))
+
+
+def connect(args):
+    import firebase_admin
+    from firebase_admin import credentials, db
+    firebase_admin.initialize_app(credentials.Certificate(args.credentials),
+                                  {"databaseURL": args.database_url})
+    return db
+
+
+def backfill(store, args):
+    db = connect(args)
+    start = time.perf_counter()
+    raw = db.reference("users").get() or {}
+    n = store.backfill(raw)
+    print(f"Backfilled {n} marks in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+def sync(store, args):
+    db = connect(args)
+    start = time.perf_counter()
+    since = args.since or store.last_day() or ""
+    # Shallow: day keys only; the newest local day is read again as it may have grown
+    days = sorted(d for d in (db.reference("attendance_days").get(shallow=True) or {}) if d >= since)
+    n = sum(store.import_day(day, db.reference(f"attendance_days/{day}").get(shallow=True))
+            for day in days)
+    print(f"Imported {n} new marks from {len(days)} days in {time.perf_counter() - start:.1f}s",
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="attendance.db")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ("day", "absent"):
+        p = sub.add_parser(name)
+        p.add_argument("day", help="YYYY-MM-DD")
+        p.add_argument("--year")
+        p.add_argument("--out", help="CSV file instead of stdout")
+    for name in ("range", "years"):
+        p = sub.add_parser(name)
+        p.add_argument("start", help="YYYY-MM-DD")
+        p.add_argument("end", help="YYYY-MM-DD")
+        if name == "range":
+            p.add_argument("--year")
+        p.add_argument("--out", help="CSV file instead of stdout")
+    for name in ("backfill", "sync"):
+        p = sub.add_parser(name)
+        p.add_argument("--credentials", required=True, help="service account JSON")
+        p.add_argument("--database-url", required=True)
+        if name == "sync":
+            p.add_argument("--since", help="YYYY-MM-DD (default: newest day in the store)")
+    args = parser.parse_args()
+
+    store = AttendanceStore(args.db)
+    if args.cmd in ("backfill", "sync"):
+        (backfill if args.cmd == "backfill" else sync)(store, args)
+        store.close()
+        return
+
+    start = time.perf_counter()
+    if args.cmd == "day":
+        header, rows = ["roll", "name", "year", "first", "last"], store.present(args.day, args.year)
+    elif args.cmd == "absent":
+        header, rows = ["roll", "name", "year"], store.absent(args.day, args.year)
+    elif args.cmd == "range":
+        header = ["roll", "name", "year", "days_present", "percent"]
+        rows = store.summary(args.start, args.end, args.year)
+    else:
+        header, rows = ["year", "students", "mean_percent"], store.by_year(args.start, args.end)
+    elapsed = (time.perf_counter() - start) * 1000
+    write_rows(header, rows, args.out)
+    print(f"{args.cmd}: {len(rows)} rows in {elapsed:.1f} ms", file=sys.stderr)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
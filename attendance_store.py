@@ -0,0 +1,185 @@
+import sqlite3
+import threading
+from gallery import iter_records
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    roll TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    year TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS students_year ON students (year, roll);
+CREATE TABLE IF NOT EXISTS marks (
+    id TEXT PRIMARY KEY,
+    roll TEXT NOT NULL,
+    day TEXT NOT NULL,
+    ts TEXT NOT NULL
+);
+-- One row per student per day present; n counts the student's present
+-- days up to and including this one, so any date range is two lookups
+CREATE TABLE IF NOT EXISTS presence (
+    roll TEXT NOT NULL,
+    day TEXT NOT NULL,
+    first TEXT NOT NULL,
+    last TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (roll, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS presence_day ON presence (day, roll);
+CREATE TABLE IF NOT EXISTS days (day TEXT PRIMARY KEY) WITHOUT ROWID;
+"""
+
+
+class AttendanceStore:
+    """Local SQLite copy of attendance for reports.
+
+    Fed by mark events as they happen (AttendanceWriter on_mark), by other
+    kiosks' marks through the attendance_days/{day} index (import_day), and
+    backfilled from `users` snapshots: both the old attendance_history lists
+    and the attendance/{day}/{key} maps. Every mark has a stable id, so
+    replays and repeated backfills never double count. Reports read the
+    per-day `presence` rows and their running counts, so a range report
+    costs the same for a week as for a semester, and never touches Firebase.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Marks arrive from the Tk and inference threads
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # -- writes --
+
+    def add_mark(self, event):
+        """One AttendanceWriter event: {"id", "roll", "ts"}"""
+        self.add_marks([event])
+
+    def add_marks(self, events):
+        """Returns how many of `events` were new"""
+        rows = [(e["id"], str(e["roll"]), e["ts"].split(" ")[0], e["ts"]) for e in events]
+        new = 0
+        with self._lock, self.conn:
+            for row in rows:
+                if self.conn.execute("INSERT OR IGNORE INTO marks VALUES (?, ?, ?, ?)", row).rowcount:
+                    self._present(*row[1:])
+                    new += 1
+        return new
+
+    def _present(self, roll, day, ts):
+        cur = self.conn.execute(
+            "UPDATE presence SET first = MIN(first, ?), last = MAX(last, ?) WHERE roll = ? AND day = ?",
+            (ts, ts, roll, day))
+        if cur.rowcount:
+            return
+        prev = self.conn.execute(
+            "SELECT n FROM presence WHERE roll = ? AND day < ? ORDER BY day DESC LIMIT 1",
+            (roll, day)).fetchone()
+        # Usually the newest day; an older one (journal replay) shifts the later counts
+        self.conn.execute("UPDATE presence SET n = n + 1 WHERE roll = ? AND day > ?", (roll, day))
+        self.conn.execute("INSERT INTO presence VALUES (?, ?, ?, ?, ?)",
+                          (roll, day, ts, ts, (prev[0] if prev else 0) + 1))
+        self.conn.execute("INSERT OR IGNORE INTO days VALUES (?)", (day,))
+
+    def _rebuild(self):
+        """Recompute presence and days from all marks in one pass (after a bulk import)"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM presence")
+            self.conn.execute(
+                "INSERT INTO presence SELECT roll, day, MIN(ts), MAX(ts), "
+                "ROW_NUMBER() OVER (PARTITION BY roll ORDER BY day) FROM marks GROUP BY roll, day")
+            self.conn.execute("DELETE FROM days")
+            self.conn.execute("INSERT INTO days SELECT DISTINCT day FROM marks")
+
+    def import_day(self, day, marks):
+        """Marks from an attendance_days/{day} snapshot ({roll: timestamp}); returns how many were new"""
+        # The index holds each roll's latest mark of the day, enough for presence
+        events = [{"id": f"d-{roll}-{ts}", "roll": roll, "ts": ts} for roll, ts in (marks or {}).items()
+                  if isinstance(ts, str) and ts.startswith(day)]
+        return self.add_marks(events)
+
+    def upsert_students(self, users):
+        """users: {roll: {"name", "year", ...}} such as a gallery's user entries"""
+        rows = [(str(roll), u.get("name", "") or "", str(u.get("year", "") or ""))
+                for roll, u in users.items()]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO students VALUES (?, ?, ?) "
+                "ON CONFLICT (roll) DO UPDATE SET name = excluded.name, year = excluded.year", rows)
+
+    def backfill(self, raw):
+        """Import students and every mark from a `users` snapshot; returns marks seen"""
+        users, events = {}, []
+        for roll, data in iter_records(raw):
+            users[roll] = data
+            for i, ts in enumerate(data.get("attendance_history") or []):
+                if isinstance(ts, str) and ts:
+                    events.append({"id": f"h-{roll}-{i}-{ts}", "roll": roll, "ts": ts})
+            for day, keyed in (data.get("attendance") or {}).items():
+                if isinstance(keyed, dict):
+                    events += [{"id": key, "roll": roll, "ts": ts} for key, ts in keyed.items()]
+        self.upsert_students(users)
+        rows = [(e["id"], e["roll"], e["ts"].split(" ")[0], e["ts"]) for e in events]
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO marks VALUES (?, ?, ?, ?)", rows)
+        self._rebuild()
+        return len(events)
+
+    # -- reports --
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def present(self, day, year=None):
+        """[(roll, name, year, first, last)] marked on `day`"""
+        return self._query(
+            "SELECT p.roll, COALESCE(s.name, ''), COALESCE(s.year, ''), p.first, p.last "
+            "FROM presence p LEFT JOIN students s ON s.roll = p.roll "
+            "WHERE p.day = ? AND (? IS NULL OR s.year = ?) ORDER BY p.roll",
+            (day, year, year))
+
+    def absent(self, day, year=None):
+        """[(roll, name, year)] of enrolled students with no mark on `day`"""
+        return self._query(
+            "SELECT roll, name, year FROM students s WHERE (? IS NULL OR year = ?) "
+            "AND NOT EXISTS (SELECT 1 FROM presence p WHERE p.roll = s.roll AND p.day = ?) "
+            "ORDER BY roll", (year, year, day))
+
+    def last_day(self):
+        """Newest day with any mark, or None"""
+        return self._query("SELECT MAX(day) FROM days")[0][0]
+
+    def class_days(self, start, end):
+        """Days in [start, end] on which anyone was marked"""
+        return [d for d, in self._query(
+            "SELECT day FROM days WHERE day BETWEEN ? AND ? ORDER BY day", (start, end))]
+
+    def summary(self, start, end, year=None):
+        """[(roll, name, year, days present, percent)] over [start, end]"""
+        days = len(self.class_days(start, end))
+        # Running count at the end of the range minus the one before its start
+        rows = self._query(
+            "SELECT s.roll, s.name, s.year, "
+            "COALESCE((SELECT n FROM presence p WHERE p.roll = s.roll AND p.day <= ? "
+            "          ORDER BY p.day DESC LIMIT 1), 0) - "
+            "COALESCE((SELECT n FROM presence p WHERE p.roll = s.roll AND p.day < ? "
+            "          ORDER BY p.day DESC LIMIT 1), 0) "
+            "FROM students s WHERE (? IS NULL OR s.year = ?) ORDER BY s.roll",
+            (end, start, year, year))
+        return [(roll, name, yr, n, round(100.0 * n / days, 1) if days else 0.0)
+                for roll, name, yr, n in rows]
+
+    def by_year(self, start, end):
+        """[(year, students, mean percent)] over [start, end]"""
+        totals = {}
+        for _, _, year, _, pct in self.summary(start, end):
+            count, total = totals.get(year, (0, 0.0))
+            totals[year] = (count + 1, total + pct)
+        return [(year, n, round(total / n, 1)) for year, (n, total) in sorted(totals.items())]
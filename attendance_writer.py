@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from metrics import Metrics
+
+
+def event_key(now):
+    """Time-ordered, collision-free key for one mark (safe as a Firebase key)"""
+    return f"{int(now.timestamp() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+
+
+def batch_updates(events):
+    """Multi-path update for a batch of marks.
+
+    Each mark is its own append-only child under
+    `users/{roll}/attendance/{YYYY-MM-DD}/{key}`, so nothing is read back,
+    writes are O(1) regardless of history, and two kiosks never overwrite
+    each other. `last_seen` keeps the newest mark per user, and
+    `attendance_days/{YYYY-MM-DD}/{roll}` indexes who was marked each day.
+    """
+    updates, last = {}, {}
+    for e in events:
+        day = e["ts"].split(" ")[0]
+        updates[f"users/{e['roll']}/attendance/{day}/{e['id']}"] = e["ts"]
+        # Replayed marks can come after newer ones: keep the newest per day too
+        key = f"attendance_days/{day}/{e['roll']}"
+        updates[key] = max(updates.get(key, ""), e["ts"])
+        last[e["roll"]] = max(last.get(e["roll"], ""), e["ts"])
+    for roll, ts in last.items():
+        updates[f"users/{roll}/last_seen"] = ts
+    return updates
+
+
+class AttendanceWriter:
+    """Non-blocking attendance writes with a durable local journal.
+
+    mark() appends the event to a JSONL journal (fsynced) and returns at
+    once; a background thread sends queued marks in batched multi-path
+    updates, retrying with backoff while the database is unreachable. Marks
+    still unacknowledged at exit are replayed from the journal next start.
+    Marks are accepted (and journaled) before the database is `ready`.
+    `on_mark(event)` is called for every new mark, e.g. AttendanceStore.add_mark.
+    """
+
+    def __init__(self, db, journal_path, batch_size=100, flush_interval=0.5, max_backoff=30.0,
+                 metrics=None, ready=None, on_mark=None):
+        self.db = db
+        self.on_mark = on_mark
+        self.ready = ready      # anything with wait(), e.g. a Deferred database client
+        self.metrics = metrics or Metrics(enabled=False)
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._stopping = False
+        self.pending = self._replay()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def mark(self, roll, now=None):
+        now = now or datetime.now()
+        event = {"id": event_key(now), "roll": str(roll), "ts": now.strftime("%Y-%m-%d %H:%M:%S")}
+        with self._cond:
+            self._journal({"op": "mark", **event})
+            self.pending[event["id"]] = event
+            self._cond.notify()
+        if self.on_mark:
+            try:
+                self.on_mark(event)
+            except Exception as e:
+                print(f"Mark listener failed: {e}")
+        return event["ts"]
+
+    def pending_marks(self):
+        """Marks not yet acknowledged by the database"""
+        with self._cond:
+            return list(self.pending.values())
+
+    def stop(self, timeout=2.0):
+        """Try to flush for up to `timeout` seconds; leftovers stay in the journal"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        if self.ready is not None:
+            self.ready.wait()
+        backoff = self.flush_interval
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.pending or self._stopping)
+                if not self.pending:
+                    return
+                if not self._stopping and len(self.pending) < self.batch_size:
+                    # Give a burst of marks the chance to share one update
+                    self._cond.wait(self.flush_interval)
+                batch = list(self.pending.values())[:self.batch_size]
+
+            try:
+                with self.metrics.time("firebase_write"):
+                    self.db.reference("/").update(batch_updates(batch))
+            except Exception as e:
+                print(f"Attendance write failed, will retry: {e}")
+                with self._cond:
+                    if self._stopping:
+                        return
+                    self._cond.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.flush_interval
+
+            with self._cond:
+                for e in batch:
+                    self.pending.pop(e["id"], None)
+                if self.pending:
+                    self._journal({"op": "ack", "ids": [e["id"] for e in batch]})
+                else:
+                    # Everything is acknowledged - start a fresh journal
+                    open(self.journal_path, "w").close()
+
+    def _journal(self, record):
+        with open(self.journal_path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _replay(self):
+        pending = {}
+        try:
+            with open(self.journal_path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    if record.get("op") == "mark":
+                        pending[record["id"]] = {k: record[k] for k in ("id", "roll", "ts")}
+                    elif record.get("op") == "ack":
+                        for key in record["ids"]:
+                            pending.pop(key, None)
+        except OSError:
+            pass
+        return pending
@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import Counter, deque
+from datetime import date
+
+
+def today():
+    return date.today().isoformat()
+
+
+class AutoMarker:
+    """Hands-free marking from a stream of recognition results.
+
+    A roll is confirmed once it is recognized in at least `min_votes` of
+    the last `frames` recognitions, so a single lucky frame above the
+    threshold never marks anyone. Rolls already marked today (seed() them
+    at startup) are kept in an in-memory index and never marked again.
+    After a mark, votes are cleared and nothing is marked for `cooldown`
+    seconds, so the next person at the door starts from a clean window.
+    """
+
+    def __init__(self, mark, frames=5, min_votes=4, cooldown=1.0, clock=time.monotonic):
+        self.mark = mark        # mark(roll) -> timestamp, e.g. AttendanceWriter.mark
+        self.frames = frames
+        self.min_votes = min(min_votes, frames)
+        self.cooldown = cooldown
+        self.clock = clock
+        self.window = deque(maxlen=frames)
+        self.day = today()
+        self.marked = set()     # rolls marked on self.day
+        self.hold_until = 0.0
+        self._lock = threading.Lock()
+
+    def seed(self, rolls, day=None):
+        """Record rolls already marked on `day` (ignored unless it is the current day)"""
+        with self._lock:
+            self._roll_over(today())
+            if (day or self.day) == self.day:
+                self.marked.update(str(r) for r in rolls)
+
+    def is_marked(self, roll, day=None):
+        with self._lock:
+            return (day or today()) == self.day and roll in self.marked
+
+    def update(self, matches, now=None, day=None):
+        """Feed one frame's [(bbox, roll, sim)]; returns [(roll, timestamp)] marked"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            self._roll_over(day or today())
+            self.window.append({roll for _, roll, _ in matches if roll})
+            if now < self.hold_until or len(self.window) < self.frames:
+                return []
+            tally = Counter(roll for rolls in self.window for roll in rolls)
+            confirmed = [roll for roll, n in tally.items()
+                         if n >= self.min_votes and roll not in self.marked]
+            if not confirmed:
+                return []
+            self.marked.update(confirmed)
+            self.window.clear()
+            self.hold_until = now + self.cooldown
+        return [(roll, self.mark(roll)) for roll in confirmed]
+
+    def _roll_over(self, day):
+        if day != self.day:
+            self.day = day
+            self.marked = set()
+            self.window.clear()
@@ -0,0 +1,174 @@
+"""Headless recognition over recorded video and image folders.
+
+    python batch_recognize.py lecture.mp4 photos/ --out results.jsonl --workers 4
+
+Frames are decoded one at a time and spread across a process pool with one
+buffalo_l instance per worker, using the same matching as the kiosk. Every
+detected face becomes one row of the output (JSONL or CSV, by extension) and
+a per-identity summary is written next to it as <out>.identities.<ext>.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+from gallery import Gallery, match_faces
+from gallery_store import GalleryStore, FirebaseBackend
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+FIELDS = ["source", "frame", "timestamp", "roll", "name", "score", "bbox"]
+ID_FIELDS = ["roll", "name", "first_seen", "last_seen", "detections", "best_score"]
+
+# Per-worker state, set up once by _init_worker
+_analyser = _gallery = _threshold = None
+
+
+def _init_worker(det_size, rolls, mat, threshold):
+    global _analyser, _gallery, _threshold
+    # Imported here so only the workers pay for loading the models
+    from face_models import create_face_analyser
+    _analyser = create_face_analyser(det_size)
+    _gallery = Gallery.from_matrix(rolls, mat)
+    _threshold = threshold
+
+
+def _recognize(frame):
+    return [(bbox.tolist(), roll, sim)
+            for bbox, roll, sim in match_faces(_analyser.get(frame), _gallery, _threshold)]
+
+
+def iter_frames(sources, every=1, start=None):
+    """(source, frame_no, timestamp, frame) for each sampled frame, decoded lazily"""
+    for src in sources:
+        if os.path.isdir(src):
+            paths = [os.path.join(src, n) for n in sorted(os.listdir(src))]
+        else:
+            paths = [src]
+        for path in paths:
+            if os.path.splitext(path)[1].lower() in IMAGE_EXTS:
+                frame = cv2.imread(path)
+                if frame is not None:
+                    mtime = datetime.fromtimestamp(os.path.getmtime(path))
+                    yield path, 0, mtime.strftime("%Y-%m-%d %H:%M:%S"), frame
+            elif os.path.isfile(path):
+                yield from _video_frames(path, every, start)
+
+
+def _video_frames(path, every, start):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    idx = 0
+    # grab() without retrieve() skips decoding the frames we do not sample
+    while cap.grab():
+        if idx % every == 0:
+            ok, frame = cap.retrieve()
+            if ok:
+                offset = timedelta(seconds=idx / fps)
+                ts = (start + offset).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if start else str(offset)
+                yield path, idx, ts, frame
+        idx += 1
+    cap.release()
+
+
+class ResultWriter:
+    """Rows to JSONL or CSV depending on the file extension"""
+
+    def __init__(self, path, fields):
+        self.fh = open(path, "w", newline="", encoding="utf-8")
+        self.csv = csv.DictWriter(self.fh, fields) if path.lower().endswith(".csv") else None
+        if self.csv:
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            self.csv.writerow({k: json.dumps(v) if isinstance(v, list) else v for k, v in row.items()})
+        else:
+            self.fh.write(json.dumps(row) + "\n")
+
+    def close(self):
+        self.fh.close()
+
+
+def load_gallery(args):
+    store = GalleryStore(args.gallery, None)
+    if args.credentials:
+        import firebase_admin
+        from firebase_admin import credentials, db
+        firebase_admin.initialize_app(credentials.Certificate(args.credentials),
+                                      {"databaseURL": args.database_url})
+        store.backend = FirebaseBackend(db)
+        store.load()
+        store.sync()
+    elif not store.load():
+        raise SystemExit(f"No gallery cache in {args.gallery}: run arcface_detect.py once "
+                         "or pass --credentials/--database-url to sync it")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sources", nargs="+", help="video files, images or image folders")
+    parser.add_argument("--out", default="results.jsonl", help=".jsonl or .csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--every", type=int, default=1, help="process every Nth video frame")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None,
+                        help="recording start time, for wall-clock video timestamps")
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--det-size", type=int, default=640)
+    parser.add_argument("--gallery", default="gallery_cache")
+    parser.add_argument("--credentials", help="service account JSON, to sync the gallery first")
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    store = load_gallery(args)
+    info = dict(zip(store.rolls, store.info))
+    base, ext = os.path.splitext(args.out)
+    frames_out = ResultWriter(args.out, FIELDS)
+    ids_out = ResultWriter(f"{base}.identities{ext}", ID_FIELDS)
+    identities = {}
+
+    def emit(src, idx, ts, future):
+        for bbox, roll, sim in future.result():
+            name = info[roll]["name"] if roll else ""
+            frames_out.write({"source": src, "frame": idx, "timestamp": ts, "roll": roll or "",
+                              "name": name, "score": round(sim, 4), "bbox": bbox})
+            if roll:
+                ident = identities.setdefault(roll, {"roll": roll, "name": name, "first_seen": ts,
+                                                     "last_seen": ts, "detections": 0, "best_score": 0.0})
+                ident["last_seen"] = ts
+                ident["detections"] += 1
+                ident["best_score"] = max(ident["best_score"], round(sim, 4))
+
+    initargs = ((args.det_size, args.det_size), store.rolls, np.asarray(store.mat), args.threshold)
+    start = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=initargs) as pool:
+        # Bounded window: decoding never runs far ahead of the workers
+        inflight = deque()
+        for src, idx, ts, frame in iter_frames(args.sources, args.every, args.start):
+            inflight.append((src, idx, ts, pool.submit(_recognize, frame)))
+            if len(inflight) >= 2 * args.workers:
+                emit(*inflight.popleft())
+                done += 1
+                if done % 100 == 0:
+                    print(f"{done} frames, {done / (time.perf_counter() - start):.1f} fps")
+        while inflight:
+            emit(*inflight.popleft())
+            done += 1
+
+    elapsed = time.perf_counter() - start
+    for ident in identities.values():
+        ids_out.write(ident)
+    frames_out.close()
+    ids_out.close()
+    print(f"Processed {done} frames in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.1f} fps), "
+          f"{len(identities)} identities -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
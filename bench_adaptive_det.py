@@ -0,0 +1,79 @@
+"""Speed vs. miss-rate of adaptive detection on a recorded clip.
+
+    python bench_adaptive_det.py kiosk_clip.mp4 --full-every 5 10 20 --min-face 60 80 120
+
+The reference is the plain 640x640 full-frame detector on every frame.
+A reference face counts as missed when no adaptive box overlaps it with
+IoU >= --iou. Each setting reports detector ms/frame, speedup and miss rate.
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from face_models import create_face_analyser, AdaptiveDetector
+from tracking import iou
+
+
+def read_clip(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run(detect, frames):
+    boxes, times = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        bboxes, _ = detect(frame)
+        times.append(time.perf_counter() - start)
+        boxes.append(bboxes[:, :4])
+    return boxes, float(np.mean(times) * 1000)
+
+
+def miss_rate(reference, candidate, threshold):
+    total = missed = 0
+    for ref, cand in zip(reference, candidate):
+        for r in ref:
+            total += 1
+            if not any(iou(r, c) >= threshold for c in cand):
+                missed += 1
+    return missed / total if total else 0.0, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("clip")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--full-every", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--min-face", type=int, nargs="+", default=[60, 80, 120])
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+
+    frames = read_clip(args.clip, args.frames)
+    if not frames:
+        raise SystemExit(f"Could not read frames from {args.clip}")
+    det = create_face_analyser(det_size=(640, 640)).det_model
+    det.detect(frames[0], metric='default')  # warm-up
+
+    reference, ref_ms = run(lambda f: det.detect(f, metric='default'), frames)
+    _, faces = miss_rate(reference, reference, args.iou)
+    print(f"{len(frames)} frames, {faces} reference faces")
+    print(f"{'setting':<28} {'ms/frame':>9} {'speedup':>8} {'miss rate':>10}")
+    print(f"{'full 640x640':<28} {ref_ms:>9.2f} {1.0:>8.2f} {0.0:>10.2%}")
+    for full_every in args.full_every:
+        for min_face in args.min_face:
+            adaptive = AdaptiveDetector(det, full_every=full_every, min_face=min_face)
+            boxes, ms = run(adaptive.detect, frames)
+            missed, _ = miss_rate(reference, boxes, args.iou)
+            label = f"full_every={full_every} min_face={min_face}"
+            print(f"{label:<28} {ms:>9.2f} {ref_ms / ms:>8.2f} {missed:>10.2%}")
+
+
+if __name__ == "__main__":
+    main()
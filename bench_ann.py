@@ -0,0 +1,68 @@
+"""Recall / latency benchmark of the IVF index against exact gallery search.
+
+    python bench_ann.py --users 100000 --nprobe 1 4 8 16 32
+
+Embeddings are synthetic 512-d identities; each query is an enrolled
+identity plus noise, which is roughly how a live ArcFace embedding sits
+around its registered mean.
+"""
+import argparse
+import time
+import numpy as np
+from gallery import Gallery
+from ann_index import IVFIndex
+
+
+def synthetic_gallery(n_users, dim, rng):
+    mat = rng.standard_normal((n_users, dim), dtype=np.float32)
+    mat /= np.linalg.norm(mat, axis=1, keepdims=True)
+    return [str(i) for i in range(n_users)], mat
+
+
+def noisy_queries(mat, n_queries, noise, rng):
+    picks = rng.choice(len(mat), n_queries, replace=False)
+    queries = mat[picks] + noise * rng.standard_normal((n_queries, mat.shape[1]), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def timed(fn, queries):
+    # One query at a time: the kiosk scores a handful of faces per frame
+    start = time.perf_counter()
+    hits = [fn(q[None, :])[0] for q in queries]
+    return hits, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    rolls, mat = synthetic_gallery(args.users, args.dim, rng)
+    queries = noisy_queries(mat, args.queries, args.noise, rng)
+
+    gallery = Gallery({r: {"emb_norm": e} for r, e in zip(rolls, mat)})
+    exact, exact_ms = timed(lambda q: gallery.search(q, k=1), queries)
+
+    start = time.perf_counter()
+    index = IVFIndex.build(rolls, mat, nlist=args.nlist)
+    build_s = time.perf_counter() - start
+
+    print(f"users={args.users} dim={args.dim} nlist={index.nlist} build={build_s:.1f}s")
+    print(f"{'nprobe':>8} {'recall@1':>9} {'ms/query':>9} {'speedup':>8}")
+    print(f"{'exact':>8} {1.0:>9.3f} {exact_ms:>9.3f} {1.0:>8.1f}")
+    for nprobe in args.nprobe:
+        approx, ms = timed(lambda q: index.search(q, k=1, nprobe=nprobe), queries)
+        recall = np.mean([bool(a) and a[0][0] == e[0][0] for a, e in zip(approx, exact)])
+        print(f"{nprobe:>8} {recall:>9.3f} {ms:>9.3f} {exact_ms / ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Throughput and false accepts of auto-mark settings on recorded clips.
+
+    python bench_auto_mark.py door_*.mp4 --labels clips.csv --frames 1 3 5 7 --votes 1 3 4
+
+--labels is a CSV with `clip,rolls` columns: the clip file name and the
+space-separated rolls of everyone who really walks through it (empty for
+clips of unenrolled people). Each clip is recognized once (every --every-th
+frame, to match the kiosk's recognition rate), then every frames/votes
+setting is replayed over the same recognitions. A mark of a roll not in the
+clip's labels is a false accept; a labelled roll never marked is a miss.
+frames=1 votes=1 is the old single-frame decision.
+"""
+import argparse
+import csv
+import os
+import cv2
+import numpy as np
+from auto_mark import AutoMarker
+from batch_recognize import load_gallery
+from face_models import create_face_analyser, get_faces
+from gallery import match_faces
+
+
+def read_labels(path):
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        return {os.path.basename(row["clip"]): set((row.get("rolls") or "").split())
+                for row in csv.DictReader(fh)}
+
+
+def recognize_clip(path, app, gallery, threshold, every):
+    """([(time, matches)], duration) over the sampled frames of one clip"""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    out, idx = [], 0
+    while cap.grab():
+        if idx % every == 0:
+            ok, frame = cap.retrieve()
+            if ok:
+                out.append((idx / fps, match_faces(get_faces(app, frame), gallery, threshold)))
+        idx += 1
+    cap.release()
+    return out, idx / fps
+
+
+def replay(recognitions, frames, votes, cooldown):
+    """{roll: time of its mark} for one setting"""
+    marked = {}
+    marker = AutoMarker(lambda roll: None, frames, votes, cooldown)
+    for t, matches in recognitions:
+        for roll, _ in marker.update(matches, now=t, day="bench"):
+            marked[roll] = t
+    return marked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("clips", nargs="+")
+    parser.add_argument("--labels", required=True)
+    parser.add_argument("--frames", type=int, nargs="+", default=[1, 3, 5, 7])
+    parser.add_argument("--votes", type=int, nargs="+", default=[1, 3, 4, 5])
+    parser.add_argument("--cooldown", type=float, default=1.0)
+    parser.add_argument("--every", type=int, default=2, help="recognize every Nth frame")
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--gallery", default="gallery_cache")
+    parser.add_argument("--credentials", help="service account JSON, to sync the gallery first")
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    labels = read_labels(args.labels)
+    gallery = load_gallery(args).gallery()
+    app = create_face_analyser()
+    clips = []
+    for path in args.clips:
+        recognitions, duration = recognize_clip(path, app, gallery, args.threshold, args.every)
+        # First frame each roll is recognized at all: the start of its time-to-mark
+        first = {}
+        for t, matches in recognitions:
+            for _, roll, _ in matches:
+                if roll:
+                    first.setdefault(roll, t)
+        clips.append((labels.get(os.path.basename(path), set()), recognitions, duration, first))
+        print(f"{path}: {len(recognitions)} recognitions over {duration:.1f}s")
+
+    total_time = sum(c[2] for c in clips)
+    people = sum(len(c[0]) for c in clips)
+    print(f"\n{len(clips)} clips, {people} labelled passes, {total_time:.0f}s of video\n")
+    print(f"{'frames':>6} {'votes':>5} {'marks':>6} {'false':>6} {'missed':>7} "
+          f"{'to mark s':>10} {'per min':>8}")
+    for frames in args.frames:
+        for votes in sorted({min(v, frames) for v in args.votes}):
+            good = false = missed = 0
+            delays = []
+            for truth, recognitions, _, first in clips:
+                marked = replay(recognitions, frames, votes, args.cooldown)
+                good += len(set(marked) & truth)
+                false += len(set(marked) - truth)
+                missed += len(truth - set(marked))
+                delays += [t - first[roll] for roll, t in marked.items() if roll in truth]
+            delay = f"{np.mean(delays):.2f}" if delays else "-"
+            print(f"{frames:>6} {votes:>5} {good:>6} {false:>6} {missed:>7} "
+                  f"{delay:>10} {good / max(total_time, 1e-9) * 60:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""CPU latency of ONNX Runtime settings, and embedding drift of int8 ArcFace models.
+
+    python bench_inference.py photos/ --threads 1 2 4 0 --opt basic all \
+        --rec-model ~/.insightface/models/buffalo_l/w600k_r50_int8.onnx
+
+Faces are detected once in the given photos (or folders of photos) and
+aligned; every setting then embeds the same crops one at a time, as a kiosk
+does, and detects on the same photos at --det-size. Drift is the cosine
+between each face's embedding and the fp32 model's under ONNX Runtime's
+default session options (not CPU_PROFILE):
+1.0 is identical, and anything close to the match threshold's margin will
+change who is recognized. Pick the fastest row whose drift you accept, and
+copy its settings into face_models.CPU_PROFILE.
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from face_models import create_face_analyser, cpu_session, CPU_PROFILE
+from quantize_recognition import face_crops, image_paths
+
+
+def timed(fn, repeat):
+    fn()  # warm-up: the first run allocates
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def unit(x):
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sources", nargs="+", help="face photos or folders of them")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 0],
+                        help="intra-op threads (0 = one per physical core)")
+    parser.add_argument("--opt", nargs="+", default=["basic", "all"],
+                        choices=("disable", "basic", "extended", "all"))
+    parser.add_argument("--rec-model", action="append", default=[], help="quantized ArcFace model(s)")
+    parser.add_argument("--max-faces", type=int, default=200)
+    parser.add_argument("--det-images", type=int, default=20, help="photos timed for detection")
+    parser.add_argument("--det-size", type=int, default=640)
+    args = parser.parse_args()
+
+    app = create_face_analyser(det_size=(args.det_size, args.det_size), profile=CPU_PROFILE)
+    rec, det = app.models["recognition"], app.det_model
+    crops = face_crops(app, args.sources, args.max_faces)
+    if not crops:
+        raise SystemExit("No faces found")
+    images = [img for img in (cv2.imread(p) for p in image_paths(args.sources)) if img is not None]
+    images = images[:args.det_images]
+    blobs = [cv2.dnn.blobFromImages([c], 1.0 / rec.input_std, rec.input_size,
+                                    (rec.input_mean,) * 3, swapRB=True) for c in crops]
+    # Reference: the fp32 model with ONNX Runtime's default session options
+    import onnxruntime as ort
+    default = ort.InferenceSession(rec.model_file, providers=["CPUExecutionProvider"])
+    reference = unit(np.vstack([default.run(rec.output_names, {rec.input_name: b})[0] for b in blobs]))
+    print(f"{len(crops)} faces, {len(images)} photos for detection\n")
+
+    print(f"{'model':<28} {'threads':>7} {'opt':>8} {'load ms':>8} {'rec ms/face':>12} "
+          f"{'det ms':>8} {'cos mean':>9} {'cos min':>8}")
+    det_session = det.session
+    for model in [rec.model_file] + args.rec_model:
+        name = "fp32" if model == rec.model_file else model.rsplit("/", 1)[-1]
+        for threads in args.threads:
+            for opt in args.opt:
+                profile = dict(CPU_PROFILE, intra_op_threads=threads, graph_optimization=opt)
+                start = time.perf_counter()
+                session = cpu_session(model, profile)
+                load = (time.perf_counter() - start) * 1000
+                run = lambda blob: session.run(rec.output_names, {rec.input_name: blob})[0]
+                rec_ms = timed(lambda: [run(b) for b in blobs], 3) / len(blobs)
+                cos = np.sum(unit(np.vstack([run(b) for b in blobs])) * reference, axis=1)
+                det_ms = "-"
+                if images and model == rec.model_file:
+                    # Detection does not depend on the recognition model: time it once per setting
+                    det.session = cpu_session(det.model_file, profile)
+                    det_ms = f"{timed(lambda: [det.detect(img, metric='default') for img in images], 2) / len(images):.1f}"
+                    det.session = det_session
+                print(f"{name:<28} {threads:>7} {opt:>8} {load:>8.0f} {rec_ms:>12.2f} "
+                      f"{det_ms:>8} {cos.mean():>9.4f} {cos.min():>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
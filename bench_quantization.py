@@ -0,0 +1,76 @@
+"""Accuracy vs. size of the compact embedding formats and quantized galleries.
+
+    python bench_quantization.py --users 100000 --noise 0.05
+
+Wire formats are compared by bytes per record (as JSON) and by the cosine
+between the original embedding and its decoded copy. In-memory precisions
+are compared by gallery bytes, top-1 agreement with the float32 gallery,
+score error, how many accept/reject decisions flip at --threshold, and
+scoring latency. Queries are noisy copies of enrolled identities plus
+impostors that are not enrolled, as in bench_ann.py.
+"""
+import argparse
+import json
+import time
+import numpy as np
+from gallery import Gallery
+from embedding_codec import FORMATS, encode, decode
+from bench_ann import synthetic_gallery, noisy_queries
+
+
+def wire_report(mat, samples):
+    print(f"{'format':<8} {'bytes/user':>11} {'min cosine':>11} {'mean cosine':>12}")
+    for fmt in FORMATS:
+        sizes, cosines = [], []
+        for emb in mat[:samples]:
+            value = encode(emb, fmt)
+            sizes.append(len(json.dumps(value)))
+            back = decode(value)
+            cosines.append(float(back @ emb / (np.linalg.norm(back) * np.linalg.norm(emb))))
+        print(f"{fmt:<8} {np.mean(sizes):>11.0f} {min(cosines):>11.6f} {np.mean(cosines):>12.6f}")
+
+
+def scored(gallery, queries):
+    start = time.perf_counter()
+    hits = [gallery.search(q[None, :], k=1)[0][0] for q in queries]
+    return hits, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def memory_report(rolls, mat, queries, threshold):
+    exact, exact_ms = scored(Gallery.from_matrix(rolls, mat), queries)
+    print(f"\n{'precision':<10} {'MB':>8} {'top-1 agree':>12} {'max |err|':>10} "
+          f"{'flips':>6} {'ms/query':>9}")
+    print(f"{'float32':<10} {mat.nbytes / 1e6:>8.1f} {1.0:>12.4f} {0.0:>10.5f} {0:>6} {exact_ms:>9.3f}")
+    for precision in ("float16", "int8"):
+        gallery = Gallery.from_matrix(rolls, mat).quantize(precision)
+        hits, ms = scored(gallery, queries)
+        agree = np.mean([h[0] == e[0] for h, e in zip(hits, exact)])
+        err = max(abs(h[1] - e[1]) for h, e in zip(hits, exact))
+        flips = sum((h[1] > threshold) != (e[1] > threshold) for h, e in zip(hits, exact))
+        nbytes = gallery.groups[mat.shape[1]][1].nbytes
+        print(f"{precision:<10} {nbytes / 1e6:>8.1f} {agree:>12.4f} {err:>10.5f} {flips:>6} {ms:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    rolls, mat = synthetic_gallery(args.users, args.dim, rng)
+    genuine = noisy_queries(mat, args.queries // 2, args.noise, rng)
+    _, impostors = synthetic_gallery(args.queries - len(genuine), args.dim, rng)
+    queries = np.vstack([genuine, impostors])
+
+    print(f"users={args.users} dim={args.dim} queries={len(queries)} (half impostors)\n")
+    wire_report(mat, min(1000, args.users))
+    memory_report(rolls, mat, queries, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
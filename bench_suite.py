@@ -0,0 +1,340 @@
+"""Offline benchmark suite for the hot paths of the attendance system.
+
+    python bench_suite.py                          # default sizes
+    python bench_suite.py --sizes 100 1000 1000000 --compare bench_results/old.json
+
+Everything is synthetic: 512-d embeddings, generated frames and a
+fake_db.FakeDB standing in for `firebase_admin.db` (with a simulated
+round-trip `--rtt`). Each stage reports latency percentiles and throughput;
+results are saved as JSON under bench_results/ so runs can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+from fake_db import FakeDB
+from gallery import (Gallery, GALLERY_FIELDS, iter_records, parse_user, mean_embedding,
+                     user_record, registration_updates)
+from gallery_store import GalleryStore, FirebaseBackend
+from attendance_writer import AttendanceWriter
+
+DIM = 512
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(stage, params, times, items=1):
+    ms = np.asarray(times) * 1000
+    return {
+        "stage": stage,
+        "params": params,
+        "n": len(times),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p90_ms": round(float(np.percentile(ms, 90)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "throughput": round(items * len(times) / max(float(np.sum(times)), 1e-12), 2),
+    }
+
+
+def unit_rows(n, rng):
+    mat = rng.standard_normal((n, DIM), dtype=np.float32)
+    mat /= np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat
+
+
+def fake_users(n, history, rng):
+    days = [f"2024-01-{d % 28 + 1:02d} 09:{d % 60:02d}:00" for d in range(history)]
+    return {str(i): {"name": f"Student {i}", "roll": str(i), "year": "2",
+                     "embedding": row.tolist(), "total_attendance": 0,
+                     "attendance_history": list(days), "updated_at": i + 1}
+            for i, row in enumerate(unit_rows(n, rng))}
+
+
+# -- stages --
+
+def bench_match(sizes, repeat, rng):
+    results = []
+    for n in sizes:
+        mat = unit_rows(n, rng)
+        rolls = [str(i) for i in range(n)]
+        build = measure(lambda: Gallery.from_matrix(rolls, mat), 3, warmup=0)
+        results.append(summarize("gallery_build", {"users": n}, build, n))
+        gallery = Gallery.from_matrix(rolls, mat)
+        for faces in (1, 4):
+            queries = list(unit_rows(faces, rng))
+            times = measure(lambda: gallery.match(queries), repeat)
+            results.append(summarize("match", {"users": n, "faces": faces}, times, faces))
+        if n <= 10000:
+            # The original per-user Python loop, for reference
+            users = {r: {"emb_norm": e} for r, e in zip(rolls, mat)}
+            q = unit_rows(1, rng)[0]
+
+            def loop():
+                best_roll, best_sim = None, 0.45
+                for roll, data in users.items():
+                    sim = np.dot(q, data["emb_norm"]) if len(q) == len(data["emb_norm"]) else 0
+                    if sim > best_sim:
+                        best_sim, best_roll = sim, roll
+            times = measure(loop, max(3, repeat // 10))
+            results.append(summarize("match_legacy_loop", {"users": n, "faces": 1}, times))
+    return results
+
+
+def check_gallery_sync():
+    """Records without a usable embedding must never break a sync (regression check)"""
+    cache = tempfile.mkdtemp(prefix="bench_gallery_")
+    try:
+        fake = FakeDB({"gallery": {"a": {"name": "A", "updated_at": 1}}, "users": {"a": {}}})
+        store = GalleryStore(cache, FirebaseBackend(fake))
+        store.sync()  # no valid embedding anywhere yet
+        fake.reference("/").update({"gallery/b": {"embedding": [1.0] * DIM, "updated_at": 2},
+                                    "gallery/c": {"embedding": "f16:AAA", "updated_at": 3},
+                                    "users/b": {"name": "B"}, "users/c": {"name": "C"}})
+        store.sync()
+        if store.rolls != ["a", "b", "c"] or store.mat.shape != (3, DIM) or len(store.gallery()) != 1:
+            raise SystemExit(f"Gallery sync regression: rolls {store.rolls}, matrix {store.mat.shape}")
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+
+
+def bench_gallery_load(sizes, history, rng):
+    check_gallery_sync()
+    results = []
+    for n in sizes:
+        users = fake_users(n, history, rng)
+        fake = FakeDB({"users": users,
+                       "gallery": {r: {k: u[k] for k in GALLERY_FIELDS} for r, u in users.items()}})
+        params = {"users": n, "history": history}
+
+        # users/ carries every attendance history; gallery/ only what matching needs
+        for stage, path in (("load_users_full", "users"), ("load_gallery_node", "gallery")):
+            def full_load():
+                raw = fake.reference(path).get() or {}
+                return {roll: parse_user(roll, d) for roll, d in iter_records(raw)}
+            fake.stats.clear()
+            results.append(summarize(stage, params, measure(full_load, 3, 0), n))
+            results[-1]["bytes_down"] = fake.stats["bytes_down"] // 3
+
+        cache = tempfile.mkdtemp(prefix="bench_gallery_")
+        try:
+            GalleryStore(cache, FirebaseBackend(fake)).sync()
+
+            def cached_load():
+                store = GalleryStore(cache, FirebaseBackend(fake))
+                store.load()
+                return store.gallery()
+            results.append(summarize("gallery_cache_load", params, measure(cached_load, 5), n))
+
+            store = GalleryStore(cache, FirebaseBackend(fake))
+            store.load()
+            fake.reference("gallery/0/updated_at").set(n + 1)
+            fake.stats.clear()
+            results.append(summarize("gallery_incremental_sync", dict(params, changed=1),
+                                     measure(store.sync, 1, 0)))
+            results[-1]["bytes_down"] = fake.stats["bytes_down"]
+        finally:
+            shutil.rmtree(cache, ignore_errors=True)
+    return results
+
+
+def bench_registration(repeat, rng, rtt):
+    embs = [rng.standard_normal(DIM).astype(np.float32) for _ in range(18)]
+    results = [summarize("registration_mean", {"captures": 18},
+                         measure(lambda: mean_embedding(embs), repeat))]
+    for fmt in ("list", "f16"):
+        # What registration writes: users/ and gallery/ in one multi-path update
+        fake = FakeDB(latency=rtt)
+        updates = registration_updates([user_record("x", "1", "1", mean_embedding(embs), fmt)])
+        n = min(repeat, 20)
+        results.append(summarize("registration_save", {"rtt_ms": rtt * 1000, "format": fmt},
+                                 measure(lambda: fake.reference("/").update(updates), n)))
+        results[-1]["bytes_up"] = fake.stats["bytes_up"] // (n + 1)
+    return results
+
+
+def bench_attendance(marks, history, rtt, rng):
+    results = []
+    params = {"marks": marks, "history": history, "rtt_ms": rtt * 1000}
+    fake = FakeDB({"users": {str(i): {"attendance_history": ["2024-01-01 09:00:00"] * history}
+                             for i in range(marks)}}, latency=rtt)
+
+    def legacy(roll):
+        # The original read-modify-write of attendance_history
+        ref = fake.reference(f"users/{roll}/attendance_history")
+        hist = ref.get() or []
+        hist.append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        ref.set(hist)
+    rolls = iter(range(marks))
+    results.append(summarize("attendance_legacy_write", params,
+                             measure(lambda: legacy(next(rolls)), marks - 1)))
+
+    fd, journal = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    writer = AttendanceWriter(fake, journal, flush_interval=0.05)
+    try:
+        rolls = iter(range(marks))
+        start = time.perf_counter()
+        times = measure(lambda: writer.mark(next(rolls)), marks - 1)
+        results.append(summarize("attendance_mark_ui", params, times))
+        while writer.pending:
+            time.sleep(0.005)
+        drained = time.perf_counter() - start
+        results.append({"stage": "attendance_writer_drain", "params": params, "n": marks,
+                        "mean_ms": round(drained * 1000, 4),
+                        "throughput": round(marks / drained, 2)})
+    finally:
+        writer.stop()
+        if os.path.exists(journal):
+            os.remove(journal)
+    return results
+
+
+def with_cpu(result, fn, repeat):
+    """Add the Tk-thread CPU time per call - what a display path costs a low-end kiosk"""
+    start = time.thread_time()
+    for _ in range(repeat):
+        fn()
+    result["cpu_ms"] = round((time.thread_time() - start) / repeat * 1000, 4)
+    return result
+
+
+def bench_display(repeat, rng):
+    frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    params = {"src": "640x480", "dst": "800x600"}
+
+    def convert():
+        small = cv2.resize(frame, (800, 600))
+        return cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    resized = np.empty((600, 800, 3), dtype=np.uint8)
+    rgb = np.empty_like(resized)
+
+    def convert_prealloc():
+        cv2.resize(frame, (800, 600), dst=resized)
+        cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=rgb)
+    results = [with_cpu(summarize("display_convert", params, measure(convert, repeat)), convert, repeat),
+               with_cpu(summarize("display_convert_prealloc", params, measure(convert_prealloc, repeat)),
+                        convert_prealloc, repeat)]
+
+    # The full path, PhotoImage included, needs PIL and a display
+    try:
+        import tkinter as tk
+        from PIL import Image, ImageTk
+        from tk_display import FrameView
+    except ImportError as e:
+        print(f"{e} - skipping display_frame stages")
+        return results
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"No Tk display ({e}) - skipping display_frame stages")
+        return results
+    label = tk.Label(root)
+    label.pack()
+
+    def legacy():
+        # The original per-frame path: new buffers and a new PhotoImage every frame
+        imgtk = ImageTk.PhotoImage(Image.fromarray(convert()))
+        label.imgtk = imgtk
+        label.configure(image=imgtk)
+    view = FrameView(label, max_fps=0, fallback=(800, 600))
+    for stage, fn in (("display_frame_legacy", legacy), ("display_frame_view", lambda: view.show(frame))):
+        results.append(with_cpu(summarize(stage, params, measure(fn, repeat)), fn, repeat))
+    root.destroy()
+    return results
+
+
+def bench_models(repeat, rng):
+    try:
+        from face_models import create_face_analyser
+    except ImportError:
+        print("insightface not installed - skipping model stage")
+        return []
+    app = create_face_analyser()
+    frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    return [summarize("face_analyser_get", {"frame": "640x480 noise"},
+                      measure(lambda: app.get(frame), repeat))]
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    old = {(r["stage"], json.dumps(r["params"], sort_keys=True)): r for r in baseline["results"]}
+    print(f"\nvs {baseline_path} ({baseline['meta']['time']})")
+    for r in current:
+        prev = old.get((r["stage"], json.dumps(r["params"], sort_keys=True)))
+        key = "p50_ms" if "p50_ms" in r else "mean_ms"
+        if prev and prev.get(key):
+            print(f"  {r['stage']:<26} {json.dumps(r['params']):<50} "
+                  f"{prev[key]:>10.3f} -> {r[key]:>10.3f} ms ({r[key] / prev[key]:.2f}x)")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000],
+                        help="gallery sizes for matching")
+    parser.add_argument("--load-sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="gallery sizes for load/sync (kept in memory as JSON-like dicts)")
+    parser.add_argument("--history", type=int, default=60, help="attendance entries per user")
+    parser.add_argument("--marks", type=int, default=200)
+    parser.add_argument("--rtt", type=float, default=0.02, help="simulated database round-trip, seconds")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--models", action="store_true", help="also time buffalo_l on a frame")
+    parser.add_argument("--out", default=None, help="results file (default bench_results/<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    results += bench_match(args.sizes, args.repeat, rng)
+    results += bench_gallery_load(args.load_sizes, args.history, rng)
+    results += bench_registration(args.repeat, rng, args.rtt)
+    results += bench_attendance(args.marks, args.history, args.rtt, rng)
+    results += bench_display(args.repeat, rng)
+    if args.models:
+        results += bench_models(max(10, args.repeat // 10), rng)
+
+    for r in results:
+        lat = f"p50 {r['p50_ms']:.3f} p90 {r['p90_ms']:.3f} p99 {r['p99_ms']:.3f} ms" \
+            if "p50_ms" in r else f"total {r['mean_ms']:.1f} ms"
+        cpu = f"  cpu {r['cpu_ms']:.3f} ms" if "cpu_ms" in r else ""
+        print(f"{r['stage']:<26} {json.dumps(r['params']):<50} {lat}  {r['throughput']:.1f}/s{cpu}")
+
+    meta = {"time": datetime.now().isoformat(timespec="seconds"), "git": git_revision(),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(), "args": vars(args)}
+    out = args.out or os.path.join("bench_results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump({"meta": meta, "results": results}, fh, indent=1)
+    print(f"\nSaved {out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
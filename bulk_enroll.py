@@ -0,0 +1,241 @@
+"""Enroll a whole intake from a roster CSV and a folder of photos per roll.
+
+    python bulk_enroll.py roster.csv photos/ --credentials key.json \
+        --database-url https://YOUR-PROJECT-ID-default-rtdb.firebaseio.com/
+
+The roster has `roll,name,year` columns; photos/<roll>/ holds that
+student's pictures (the largest face in each is used). Embeddings are
+computed in worker processes and averaged like a kiosk registration.
+A student whose template already matches someone in the gallery (or
+earlier in this run) above --duplicate-threshold is reported, not written.
+Users are written in batched multi-path updates. Rolls must be numeric, as
+in the registration GUI; other rows are recorded as invalid and skipped.
+
+Every outcome is appended to a state file (<roster>.state.jsonl), so an
+interrupted run picks up where it stopped; --retry also redoes students
+that previously had no usable face or were flagged as duplicates.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from gallery import mean_embedding, normalize, user_record, registration_updates
+from batch_recognize import IMAGE_EXTS, load_gallery
+
+# Per-worker face analyser, set up once by _init_worker
+_analyser = None
+
+
+def _init_worker(det_size):
+    global _analyser
+    from face_models import create_face_analyser
+    _analyser = create_face_analyser(det_size)
+
+
+def _embed_roll(task):
+    """(roll, mean embedding or None, photos used, photos found)"""
+    roll, paths = task
+    embs = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        faces = _analyser.get(img)
+        if faces:
+            face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+            embs.append(face.embedding)
+    return roll, (mean_embedding(embs) if embs else None), len(embs), len(paths)
+
+
+def read_roster(path):
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        rows = [{k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+                for row in csv.DictReader(fh)]
+    return [r for r in rows if r.get("roll")]
+
+
+def photo_paths(photos_dir, roll):
+    folder = os.path.join(photos_dir, roll)
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, n) for n in sorted(os.listdir(folder))
+            if os.path.splitext(n)[1].lower() in IMAGE_EXTS]
+
+
+def load_state(path):
+    """roll -> last recorded outcome"""
+    state = {}
+    try:
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line after a crash
+                state[record["roll"]] = record
+    except OSError:
+        pass
+    return state
+
+
+class Enrollment:
+    """Duplicate checks, batched writes and the resumable state file"""
+
+    def __init__(self, db, gallery, capacity, state_path, batch_size=200,
+                 duplicate_threshold=0.6, embedding_format="list", dry_run=False):
+        self.db = db
+        self.gallery = gallery
+        self.state_fh = open(state_path, "a", encoding="utf-8")
+        self.batch_size = batch_size
+        self.duplicate_threshold = duplicate_threshold
+        self.embedding_format = embedding_format
+        self.dry_run = dry_run
+        # Templates enrolled in this run, for duplicates within the intake
+        self.new_rolls = []
+        self.new_mat = None
+        self.capacity = capacity
+        self.batch = {}
+        self.counts = {}
+
+    def add(self, student, emb, used, found):
+        roll = student["roll"]
+        if emb is None:
+            return self._record(roll, "no_face", photos=found)
+        unit = normalize(emb)
+        dup = self._duplicate(unit)
+        if dup:
+            return self._record(roll, "duplicate", match=dup[0], score=round(dup[1], 4))
+        if self.new_mat is None:
+            self.new_mat = np.zeros((self.capacity, unit.size), dtype=np.float32)
+        if unit.size == self.new_mat.shape[1]:
+            self.new_mat[len(self.new_rolls)] = unit
+            self.new_rolls.append(roll)
+        self.batch[roll] = (user_record(student.get("name", ""), roll, student.get("year", ""),
+                                        emb, self.embedding_format), used)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def _duplicate(self, unit):
+        (roll, score), = self.gallery.match([unit], self.duplicate_threshold)
+        if roll:
+            return roll, score
+        if self.new_rolls and unit.size == self.new_mat.shape[1]:
+            scores = self.new_mat[:len(self.new_rolls)] @ unit
+            best = int(np.argmax(scores))
+            if scores[best] > self.duplicate_threshold:
+                return self.new_rolls[best], float(scores[best])
+        return None
+
+    def flush(self):
+        if not self.batch:
+            return
+        updates = registration_updates(record for record, _ in self.batch.values())
+        if not self.dry_run:
+            for attempt in range(4):
+                try:
+                    self.db.reference("/").update(updates)
+                    break
+                except Exception as e:
+                    if attempt == 3:
+                        # Left unrecorded, so the next run redoes them (and close() does not retry)
+                        self.batch = {}
+                        raise SystemExit(f"Write failed ({e}); re-run to resume")
+                    print(f"Write failed, retrying: {e}")
+                    time.sleep(2 ** attempt)
+        for roll, (_, used) in self.batch.items():
+            self._record(roll, "dry_run" if self.dry_run else "written", photos=used)
+        self.batch = {}
+
+    def _record(self, roll, status, **extra):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if status == "dry_run":
+            return
+        self.state_fh.write(json.dumps({"roll": roll, "status": status, **extra}) + "\n")
+        self.state_fh.flush()
+        os.fsync(self.state_fh.fileno())
+
+    def close(self):
+        self.flush()
+        self.state_fh.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("roster", help="CSV with roll,name,year columns")
+    parser.add_argument("photos", help="folder with one sub-folder of photos per roll")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=200, help="users per multi-path update")
+    parser.add_argument("--duplicate-threshold", type=float, default=0.6)
+    parser.add_argument("--format", default="list", choices=("list", "f16", "i8"),
+                        help="embedding storage format (see embedding_codec); "
+                             "f16/i8 only once every kiosk is updated")
+    parser.add_argument("--state", help="progress file (default <roster>.state.jsonl)")
+    parser.add_argument("--retry", action="store_true", help="redo no_face/duplicate students")
+    parser.add_argument("--dry-run", action="store_true", help="embed and check, write nothing")
+    parser.add_argument("--det-size", type=int, default=640)
+    parser.add_argument("--gallery", default="gallery_cache")
+    parser.add_argument("--credentials", required=True, help="service account JSON")
+    parser.add_argument("--database-url", required=True)
+    args = parser.parse_args()
+
+    state_path = args.state or os.path.splitext(args.roster)[0] + ".state.jsonl"
+    state = load_state(state_path)
+    store = load_gallery(args)  # synced, so it includes earlier runs' writes
+    from firebase_admin import db
+
+    registered = set(store.rolls)
+    todo, skipped, invalid = [], {}, []
+    for student in read_roster(args.roster):
+        prev = state.get(student["roll"], {}).get("status")
+        if not student["roll"].isdigit():
+            # Same rule as the registration GUI; other characters can break a whole batch
+            reason = "roll must be numeric"
+            if prev != "invalid":
+                invalid.append(student["roll"])
+        elif student["roll"] in registered or prev == "written":
+            reason = "already registered"
+        elif prev and not args.retry:
+            reason = f"previously {prev}"
+        else:
+            todo.append(student)
+            continue
+        skipped[reason] = skipped.get(reason, 0) + 1
+    for reason, n in skipped.items():
+        print(f"Skipping {n} students: {reason}")
+
+    enrollment = Enrollment(db, store.gallery(), len(todo), state_path, args.batch_size,
+                            args.duplicate_threshold, args.format, args.dry_run)
+    for roll in invalid:
+        enrollment._record(roll, "invalid")
+    if not todo:
+        enrollment.close()
+        print("Nothing to enroll")
+        return
+    tasks = [(s["roll"], photo_paths(args.photos, s["roll"])) for s in todo]
+    by_roll = {s["roll"]: s for s in todo}
+    start = time.perf_counter()
+    photos = 0
+    try:
+        with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                                 initargs=((args.det_size, args.det_size),)) as pool:
+            for done, (roll, emb, used, found) in enumerate(pool.map(_embed_roll, tasks, chunksize=4), 1):
+                photos += found
+                enrollment.add(by_roll[roll], emb, used, found)
+                if done % 50 == 0 or done == len(tasks):
+                    elapsed = time.perf_counter() - start
+                    print(f"{done}/{len(tasks)} students, {done / elapsed:.1f} students/s, "
+                          f"{photos / elapsed:.1f} photos/s")
+    finally:
+        enrollment.close()
+
+    elapsed = time.perf_counter() - start
+    summary = ", ".join(f"{n} {status}" for status, n in sorted(enrollment.counts.items()))
+    print(f"Done in {elapsed:.1f}s: {summary}. State: {state_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import base64
+import numpy as np
+
+# Wire formats for `users/{roll}/embedding`:
+#   list  - JSON list of floats (the original format, ~10 KB for 512-d)
+#   f16   - "f16:" + base64 of little-endian float16 values (~1.4 KB)
+#   i8    - "i8:" + base64 of a float32 scale followed by int8 values (~0.7 KB)
+# decode() accepts all three, so old and new records can be mixed freely.
+FORMATS = ("list", "f16", "i8")
+
+
+def encode(emb, fmt="f16"):
+    emb = np.asarray(emb, dtype=np.float32).ravel()
+    if fmt == "list":
+        return emb.tolist()
+    if fmt == "f16":
+        return "f16:" + base64.b64encode(emb.astype("<f2").tobytes()).decode("ascii")
+    if fmt == "i8":
+        scale, q = _quantize_rows(emb[None, :])
+        raw = scale.astype("<f4").tobytes() + q.tobytes()
+        return "i8:" + base64.b64encode(raw).decode("ascii")
+    raise ValueError(f"Unknown embedding format: {fmt}")
+
+
+def decode(value):
+    """float32 vector from any supported format (empty for missing/unknown)"""
+    if isinstance(value, str):
+        fmt, _, body = value.partition(":")
+        try:
+            raw = base64.b64decode(body)
+        except ValueError:
+            return np.zeros(0, dtype=np.float32)
+        try:
+            if fmt == "f16":
+                return np.frombuffer(raw, dtype="<f2").astype(np.float32)
+            if fmt == "i8" and len(raw) >= 4:
+                scale = np.frombuffer(raw[:4], dtype="<f4")[0]
+                return np.frombuffer(raw[4:], dtype=np.int8).astype(np.float32) * scale
+        except ValueError:
+            pass  # truncated payload
+        return np.zeros(0, dtype=np.float32)
+    try:
+        return np.asarray(value if value is not None else [], dtype=np.float32).ravel()
+    except (TypeError, ValueError):
+        return np.zeros(0, dtype=np.float32)
+
+
+def _quantize_rows(mat):
+    """Symmetric per-row int8: (scales, int8 matrix) with row ~= q * scale"""
+    scale = np.abs(mat).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(mat / scale[:, None]), -127, 127).astype(np.int8)
+    return scale.astype(np.float32), q
+
+
+class QuantizedMatrix:
+    """A (users x dim) embedding matrix held as float16 or per-row int8.
+
+    Scored in chunks that are widened to float32 just for the matmul, so
+    the float32 copy of the whole gallery never exists in memory.
+    """
+
+    def __init__(self, mat, precision="int8", chunk=2048):
+        if precision not in ("float16", "int8"):
+            raise ValueError(f"Unknown precision: {precision}")
+        self.precision = precision
+        self.chunk = chunk
+        self.shape = mat.shape
+        self.data = np.empty(mat.shape, dtype=np.float16 if precision == "float16" else np.int8)
+        self.scale = np.empty(mat.shape[0], dtype=np.float32) if precision == "int8" else None
+        # Chunked, so a memory-mapped float32 source is never fully loaded;
+        # small chunks also keep the widened block in cache while scoring
+        for i in range(0, mat.shape[0], chunk):
+            block = np.asarray(mat[i:i + chunk], dtype=np.float32)
+            if self.scale is None:
+                self.data[i:i + chunk] = block
+            else:
+                self.scale[i:i + chunk], self.data[i:i + chunk] = _quantize_rows(block)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def scores(self, queries):
+        """queries @ mat.T for float32 (n x dim) queries"""
+        out = np.empty((len(queries), self.shape[0]), dtype=np.float32)
+        for i in range(0, self.shape[0], self.chunk):
+            block = self.data[i:i + self.chunk].astype(np.float32)
+            out[:, i:i + self.chunk] = queries @ block.T
+        if self.scale is not None:
+            out *= self.scale
+        return out
+
+    def dequantize(self):
+        mat = self.data.astype(np.float32)
+        return mat * self.scale[:, None] if self.scale is not None else mat
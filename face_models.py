@@ -0,0 +1,183 @@
+import numpy as np
+from metrics import Metrics
+
+_NO_METRICS = Metrics(enabled=False)
+
+# Only what matching needs - skips the 2D/3D landmark and gender-age models
+# of the buffalo_l pack. Pass allowed_modules=None to load everything.
+RECOGNITION_MODULES = ("detection", "recognition")
+
+# ONNX Runtime settings for CPU-only kiosks, passed as
+# create_face_analyser(profile=...). Pick values per machine with
+# bench_inference.py.
+CPU_PROFILE = {
+    "intra_op_threads": 0,              # threads within one operator; 0 = one per physical core
+    "inter_op_threads": 1,              # operators run side by side ("parallel" mode only)
+    "execution_mode": "sequential",     # or "parallel"
+    "graph_optimization": "all",        # "disable", "basic", "extended" or "all"
+    "recognition_model": None,          # e.g. the int8 ArcFace from quantize_recognition.py
+}
+
+# One InferenceSession per (model file, settings), shared by every analyser
+# in the process
+_SESSIONS = {}
+
+
+def create_face_analyser(det_size=(640, 640), allowed_modules=RECOGNITION_MODULES, profile=None):
+    """buffalo_l with GPU preference (falls back to CPU automatically),
+    or CPU only with the ONNX Runtime settings of `profile` (see CPU_PROFILE)"""
+    # insightface (and onnxruntime) are imported here, not at module level,
+    # so importing this module does not slow the window coming up
+    from insightface.app import FaceAnalysis
+    app = FaceAnalysis(
+        name="buffalo_l",
+        allowed_modules=list(allowed_modules) if allowed_modules else None,
+        providers=['CPUExecutionProvider'] if profile else ['CUDAExecutionProvider', 'CPUExecutionProvider']
+    )
+    if profile:
+        apply_profile(app, profile)
+    app.prepare(ctx_id=0, det_size=det_size)
+    return app
+
+
+def cpu_session(model_file, profile):
+    """Shared CPU InferenceSession for `model_file` with `profile`'s settings"""
+    import onnxruntime as ort
+    settings = {k: v for k, v in profile.items() if k != "recognition_model"}
+    key = (model_file, tuple(sorted(settings.items())))
+    if key not in _SESSIONS:
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = settings.get("intra_op_threads", 0)
+        opts.inter_op_num_threads = settings.get("inter_op_threads", 0)
+        opts.execution_mode = (ort.ExecutionMode.ORT_PARALLEL
+                               if settings.get("execution_mode") == "parallel"
+                               else ort.ExecutionMode.ORT_SEQUENTIAL)
+        opts.graph_optimization_level = {
+            "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        }.get(settings.get("graph_optimization"), ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+        _SESSIONS[key] = ort.InferenceSession(model_file, sess_options=opts,
+                                              providers=["CPUExecutionProvider"])
+    return _SESSIONS[key]
+
+
+def apply_profile(app, profile):
+    """Swap each model's session for a tuned, shared one.
+
+    insightface builds its sessions without SessionOptions, so they are
+    replaced after loading. The models keep the preprocessing they read
+    from the fp32 files; a quantized `recognition_model` has the same
+    inputs and outputs, so only its session changes.
+    """
+    for taskname, model in app.models.items():
+        model_file = model.model_file
+        if taskname == "recognition" and profile.get("recognition_model"):
+            model_file = profile["recognition_model"]
+        model.session = cpu_session(model_file, profile)
+
+
+def get_faces(app, img, metrics=None, max_num=0, detector=None):
+    """FaceAnalysis.get with detection and each per-face model timed separately.
+
+    `detector` (e.g. an AdaptiveDetector) replaces the plain full-frame scan.
+    """
+    from insightface.app.common import Face
+    metrics = metrics or _NO_METRICS
+    with metrics.time("detect"):
+        if detector is not None:
+            bboxes, kpss = detector.detect(img, max_num=max_num)
+        else:
+            bboxes, kpss = app.det_model.detect(img, max_num=max_num, metric='default')
+    faces = []
+    for i in range(bboxes.shape[0]):
+        face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None,
+                    det_score=bboxes[i, 4])
+        for taskname, model in app.models.items():
+            if taskname == 'detection':
+                continue
+            with metrics.time(taskname):
+                model.get(img, face)
+        faces.append(face)
+    return faces
+
+
+class AdaptiveDetector:
+    """Runs the detector on as few pixels as the faces allow.
+
+    Every `full_every` frames (or whenever the region of interest comes up
+    empty) the whole frame is scanned, at the smallest input size that still
+    shows a `min_face`-pixel newcomer to the detector at `det_min_face`
+    pixels. In between, only a padded box around the previous faces is
+    scanned, with an input size picked from the smallest of those faces -
+    a big face at the kiosk needs only a small input.
+    """
+
+    SIZES = (128, 160, 192, 256, 320, 416, 480, 640)
+
+    def __init__(self, det_model, full_every=10, pad=0.5, min_face=80, det_min_face=40):
+        self.det_model = det_model
+        self.full_every = full_every
+        self.pad = pad
+        self.min_face = min_face
+        self.det_min_face = det_min_face
+        self.prev = None        # bboxes from the last frame
+        self.since_full = 0
+
+    def input_size(self, region, face):
+        """Smallest detector input showing a `face`-pixel face in `region` at det_min_face px"""
+        need = self.det_min_face * region / max(face, 1)
+        for size in self.SIZES:
+            if size >= need:
+                return size, size
+        return self.SIZES[-1], self.SIZES[-1]
+
+    def detect(self, img, max_num=0):
+        """Same contract as det_model.detect: (bboxes with scores, kpss)"""
+        h, w = img.shape[:2]
+        if self.prev is not None and len(self.prev) and self.since_full + 1 < self.full_every:
+            bboxes, kpss = self._detect_roi(img, w, h, max_num)
+            if len(bboxes):
+                self.since_full += 1
+                self.prev = bboxes
+                return bboxes, kpss
+        bboxes, kpss = self.det_model.detect(img, input_size=self.input_size(max(w, h), self.min_face),
+                                             max_num=max_num, metric='default')
+        self.since_full = 0
+        self.prev = bboxes
+        return bboxes, kpss
+
+    def _detect_roi(self, img, w, h, max_num):
+        x1, y1 = self.prev[:, 0].min(), self.prev[:, 1].min()
+        x2, y2 = self.prev[:, 2].max(), self.prev[:, 3].max()
+        pad = self.pad * max(x2 - x1, y2 - y1)
+        x1, y1 = int(max(0, x1 - pad)), int(max(0, y1 - pad))
+        x2, y2 = int(min(w, x2 + pad)), int(min(h, y2 + pad))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return np.zeros((0, 5), dtype=np.float32), None
+        smallest = min(min(b[2] - b[0], b[3] - b[1]) for b in self.prev)
+        size = self.input_size(max(x2 - x1, y2 - y1), smallest)
+        bboxes, kpss = self.det_model.detect(img[y1:y2, x1:x2], input_size=size,
+                                             max_num=max_num, metric='default')
+        # Back to full-frame coordinates
+        bboxes[:, [0, 2]] += x1
+        bboxes[:, [1, 3]] += y1
+        if kpss is not None:
+            kpss[:, :, 0] += x1
+            kpss[:, :, 1] += y1
+        return bboxes, kpss
+
+
+def embed_faces(app, items, metrics=None, max_batch=32):
+    """ArcFace embeddings for [(img, kps)] from any number of frames,
+    computed in batched recognition calls instead of one call per face"""
+    from insightface.utils import face_align
+    metrics = metrics or _NO_METRICS
+    rec = app.models["recognition"]
+    crops = [face_align.norm_crop(img, landmark=kps, image_size=rec.input_size[0])
+             for img, kps in items]
+    out = []
+    with metrics.time("recognition"):
+        for i in range(0, len(crops), max_batch):
+            out.append(rec.get_feat(crops[i:i + max_batch]))
+    return np.vstack(out) if out else np.zeros((0, 0), dtype=np.float32)
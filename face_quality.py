@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+
+# Head pose from the five detector keypoints (eyes, nose, mouth corners):
+#   yaw   = nose offset from the eye midpoint, in inter-eye distances;
+#           positive when the subject turns to their left (image right)
+#   pitch = nose height between the eye line (0) and the mouth line (1);
+#           lower when looking up, higher when looking down
+# Allowed (min, max) per pose; None means unconstrained.
+POSES = {
+    "straight": ((-0.12, 0.12), (0.40, 0.68)),
+    "left": ((0.12, 0.60), None),
+    "right": ((-0.60, -0.12), None),
+    "up": ((-0.20, 0.20), (None, 0.45)),
+    "down": ((-0.20, 0.20), (0.63, None)),
+}
+
+
+def head_pose(kps):
+    """(yaw, pitch) ratios from a 5x2 keypoint array"""
+    left_eye, right_eye, nose, mouth_l, mouth_r = np.asarray(kps, dtype=np.float32)
+    eyes = (left_eye + right_eye) / 2
+    mouth = (mouth_l + mouth_r) / 2
+    eye_dist = max(float(np.linalg.norm(right_eye - left_eye)), 1e-6)
+    yaw = float(nose[0] - eyes[0]) / eye_dist
+    pitch = float(nose[1] - eyes[1]) / max(float(mouth[1] - eyes[1]), 1e-6)
+    return yaw, pitch
+
+
+def sharpness(img, bbox, size=112):
+    """Variance of the Laplacian over the face, resampled to a fixed width"""
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = [int(v) for v in bbox[:4]]
+    crop = img[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+    if crop.size == 0:
+        return 0.0
+    crop = cv2.resize(crop, (size, max(1, size * crop.shape[0] // crop.shape[1])))
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def _within(value, bounds):
+    if bounds is None:
+        return True
+    lo, hi = bounds
+    return (lo is None or value >= lo) and (hi is None or value <= hi)
+
+
+def check_capture(img, faces, pose=None, min_face=100, min_sharpness=60.0):
+    """None when `faces` is a usable enrollment capture, else the reason it is not"""
+    if not faces:
+        return "No face detected"
+    if len(faces) > 1:
+        return "Only one face should be visible"
+    face = faces[0]
+    if min(face.bbox[2] - face.bbox[0], face.bbox[3] - face.bbox[1]) < min_face:
+        return "Move closer"
+    if sharpness(img, face.bbox) < min_sharpness:
+        return "Hold still"
+    if pose and face.kps is not None:
+        yaw_range, pitch_range = POSES[pose]
+        yaw, pitch = head_pose(face.kps)
+        if not (_within(yaw, yaw_range) and _within(pitch, pitch_range)):
+            return "Adjust pose"
+    return None
@@ -0,0 +1,215 @@
+"""In-process stand-in for `firebase_admin.db`, for offline runs and benchmarks.
+
+    fake = FakeDB({"users": {...}})
+    fake.reference("users/42").get()
+
+Supports the subset of the Realtime Database API this project uses: get
+(including shallow), set, update (multi-path), push, delete and ordered
+queries. `latency` adds a simulated round-trip per call and `stats` counts
+calls and JSON bytes moved in each direction.
+"""
+import copy
+import json
+import threading
+import time
+from collections import Counter
+
+SERVER_TIMESTAMP = {".sv": "timestamp"}
+
+
+def _split(path):
+    return [p for p in path.strip("/").split("/") if p]
+
+
+def _resolve(value):
+    """Replace server-value placeholders the way the real backend does"""
+    if value == SERVER_TIMESTAMP:
+        return int(time.time() * 1000)
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v) for v in value]
+    return value
+
+
+def _get_child(value, path):
+    for p in _split(path):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(p)
+    return value
+
+
+class FakeDB:
+    def __init__(self, data=None, latency=0.0):
+        self.data = data if data is not None else {}
+        self.latency = latency
+        self.stats = Counter()
+        self._lock = threading.RLock()
+        self._push_seq = 0
+
+    def reference(self, path="/"):
+        return FakeReference(self, path)
+
+    # -- tree access, all under the lock --
+    def _call(self, up=None, down=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.stats["calls"] += 1
+        if up is not None:
+            self.stats["bytes_up"] += len(json.dumps(up))
+        if down is not None:
+            self.stats["bytes_down"] += len(json.dumps(down))
+
+    def _get(self, parts):
+        node = self.data
+        for p in parts:
+            if isinstance(node, dict) and p in node:
+                node = node[p]
+            elif isinstance(node, list) and p.isdigit() and int(p) < len(node):
+                node = node[int(p)]
+            else:
+                return None
+        return node
+
+    def _set(self, parts, value):
+        if not parts:
+            self.data = value if isinstance(value, dict) else {}
+            return
+        node = self.data
+        for p in parts[:-1]:
+            child = node.get(p)
+            if not isinstance(child, dict):
+                # Lists are stored as index-keyed dicts once written into
+                child = {str(i): v for i, v in enumerate(child)} if isinstance(child, list) else {}
+                node[p] = child
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def _next_push_key(self):
+        # Time-ordered like real push IDs, unique within this process
+        self._push_seq += 1
+        return f"{int(time.time() * 1000):013d}{self._push_seq:07d}"
+
+
+class FakeReference:
+    def __init__(self, db, path):
+        self._db = db
+        self._parts = _split(path)
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return "/" + "/".join(self._parts)
+
+    def child(self, path):
+        return FakeReference(self._db, "/".join(self._parts + _split(path)))
+
+    def get(self, shallow=False):
+        with self._db._lock:
+            node = self._db._get(self._parts)
+            if shallow and isinstance(node, (dict, list)):
+                items = node.items() if isinstance(node, dict) else enumerate(node)
+                node = {str(k): True if isinstance(v, (dict, list)) else v
+                        for k, v in items if v is not None}
+            else:
+                node = copy.deepcopy(node)
+        self._db._call(down=node)
+        return node
+
+    def set(self, value):
+        value = _resolve(copy.deepcopy(value))
+        self._db._call(up=value)
+        with self._db._lock:
+            self._db._set(self._parts, value)
+
+    def update(self, value):
+        """Multi-path update: keys may be nested paths relative to this node"""
+        value = _resolve(copy.deepcopy(value))
+        self._db._call(up=value)
+        with self._db._lock:
+            for k, v in value.items():
+                self._db._set(self._parts + _split(k), v)
+
+    def push(self, value=""):
+        with self._db._lock:
+            key = self._db._next_push_key()
+        ref = self.child(key)
+        ref.set(value)
+        return ref
+
+    def delete(self):
+        self._db._call()
+        with self._db._lock:
+            self._db._set(self._parts, None)
+
+    def order_by_child(self, path):
+        return FakeQuery(self, lambda k, v: _get_child(v, path))
+
+    def order_by_key(self):
+        return FakeQuery(self, lambda k, v: k)
+
+    def order_by_value(self):
+        return FakeQuery(self, lambda k, v: v)
+
+
+class FakeQuery:
+    def __init__(self, ref, key_fn):
+        self._ref = ref
+        self._key_fn = key_fn
+        self._start = self._end = None
+        self._first = self._last = None
+
+    def start_at(self, value):
+        self._start = value
+        return self
+
+    def end_at(self, value):
+        self._end = value
+        return self
+
+    def equal_to(self, value):
+        self._start = self._end = value
+        return self
+
+    def limit_to_first(self, n):
+        self._first = n
+        return self
+
+    def limit_to_last(self, n):
+        self._last = n
+        return self
+
+    def get(self):
+        with self._ref._db._lock:
+            node = self._ref._db._get(self._ref._parts)
+            items = node.items() if isinstance(node, dict) else enumerate(node or [])
+            rows = []
+            for k, v in items:
+                if v is None:
+                    continue
+                sort_key = self._key_fn(str(k), v)
+                # Like the real backend, children without the ordered field sort
+                # first and never satisfy a start_at/end_at bound
+                if (self._start is not None or self._end is not None) and sort_key is None:
+                    continue
+                if self._start is not None and sort_key < self._start:
+                    continue
+                if self._end is not None and sort_key > self._end:
+                    continue
+                rows.append(((sort_key is not None, sort_key), str(k), v))
+            rows.sort(key=lambda r: (r[0], r[1]))
+            if self._first is not None:
+                rows = rows[:self._first]
+            if self._last is not None:
+                rows = rows[-self._last:]
+            # Only the matching children are copied out, as only they would be sent
+            result = {k: copy.deepcopy(v) for _, k, v in rows}
+        self._ref._db._call(down=result)
+        return result
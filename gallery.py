@@ -0,0 +1,174 @@
+import numpy as np
+from embedding_codec import encode, decode, QuantizedMatrix
+
+# What kiosks download per user. Registration mirrors these fields of
+# users/{roll} into gallery/{roll}, so loading the gallery never pulls
+# attendance history, however long the system has been running.
+GALLERY_FIELDS = ("name", "roll", "year", "embedding", "updated_at")
+
+
+def normalize(emb):
+    """Return a float32 unit vector, or None for an empty / zero-norm embedding"""
+    emb = np.asarray(emb, dtype=np.float32).ravel()
+    nrm = np.linalg.norm(emb)
+    if emb.size == 0 or nrm == 0:
+        return None
+    return emb / nrm
+
+
+def mean_embedding(embs):
+    """Registration template: the plain mean of the captured embeddings"""
+    return np.mean(np.array(embs), axis=0).tolist()
+
+
+def iter_records(raw):
+    """(roll, record) pairs from a `users` snapshot"""
+    # Robustly parse both dict and list outputs
+    if isinstance(raw, dict):
+        iterable = raw.items()
+    elif isinstance(raw, list):
+        # list may contain None if there are firebase "gaps"
+        iterable = ((str(u.get('roll')) if u else '', u) for u in raw if isinstance(u, dict))
+    else:
+        iterable = []
+    for roll, data in iterable:
+        if isinstance(data, dict):
+            yield str(roll), data
+
+
+def parse_user(roll, data):
+    """In-memory gallery entry for one `users/{roll}` record"""
+    emb = decode(data.get("embedding"))
+    emb_norm = emb / np.linalg.norm(emb) if np.linalg.norm(emb) > 0 else emb
+    return {
+        "name": data.get("name", ""),
+        "roll": str(data.get("roll", roll)),
+        "year": data.get("year", ""),
+        "emb_norm": emb_norm
+    }
+
+
+def user_record(name, roll, year, embedding, fmt="list"):
+    """A new `users/{roll}` record, as written by registration"""
+    return {
+        "name": name,
+        "roll": roll,
+        "year": year,
+        "embedding": encode(embedding, fmt),
+        "total_attendance": 0,
+        "attendance_history": [],
+        # Server timestamp - lets kiosk gallery caches sync incrementally
+        "updated_at": {".sv": "timestamp"}
+    }
+
+
+def registration_updates(records):
+    """Multi-path update writing users/{roll} and its gallery/{roll} copy"""
+    updates = {}
+    for record in records:
+        updates[f"users/{record['roll']}"] = record
+        updates[f"gallery/{record['roll']}"] = {k: record[k] for k in GALLERY_FIELDS if k in record}
+    return updates
+
+
+class Gallery:
+    """Every enrolled `emb_norm` stacked in one contiguous float32 matrix per
+    embedding dimension, so a whole frame is scored with a single matmul."""
+
+    def __init__(self, users, index=None):
+        grouped = {}
+        for roll, data in users.items():
+            emb = np.asarray(data.get("emb_norm", []), dtype=np.float32).ravel()
+            # Zero-norm rows can never beat the threshold - leave them out
+            if emb.size == 0 or not np.any(emb):
+                continue
+            rolls, rows = grouped.setdefault(emb.size, ([], []))
+            rolls.append(roll)
+            rows.append(emb)
+        # Mixed dimensions are kept apart: a face is only ever compared
+        # with embeddings of its own length, like the old per-user check
+        self.groups = {
+            dim: (rolls, np.ascontiguousarray(np.vstack(rows), dtype=np.float32))
+            for dim, (rolls, rows) in grouped.items()
+        }
+        # Optional ann_index.IVFIndex used instead of brute force for its dimension
+        self.index = index
+
+    @classmethod
+    def from_matrix(cls, rolls, mat, index=None):
+        """Gallery over an already normalized (users x dim) matrix, e.g. a memory map"""
+        gallery = cls({}, index)
+        keep = np.flatnonzero(np.any(mat, axis=1))
+        if len(keep):
+            gallery.groups[mat.shape[1]] = (
+                [rolls[i] for i in keep],
+                np.ascontiguousarray(mat if len(keep) == len(mat) else mat[keep], dtype=np.float32))
+        return gallery
+
+    def __len__(self):
+        return sum(len(rolls) for rolls, _ in self.groups.values())
+
+    def quantize(self, precision="int8"):
+        """Hold every group as float16 or int8 (embedding_codec.QuantizedMatrix)"""
+        if precision in (None, "float32"):
+            return self
+        self.groups = {
+            dim: (rolls, mat if isinstance(mat, QuantizedMatrix) else QuantizedMatrix(mat, precision))
+            for dim, (rolls, mat) in self.groups.items()
+        }
+        return self
+
+    def search(self, embs, k=1):
+        """Top-k (roll, score) per query embedding, best first"""
+        results = [[] for _ in embs]
+        by_dim = {}
+        for i, emb in enumerate(embs):
+            by_dim.setdefault(len(emb), []).append(i)
+
+        for dim, idxs in by_dim.items():
+            if dim not in self.groups:
+                continue
+            queries = np.vstack([embs[i] for i in idxs]).astype(np.float32, copy=False)
+            if self.index is not None and self.index.dim == dim:
+                for i, hits in zip(idxs, self.index.search(queries, k)):
+                    results[i] = hits
+                continue
+            rolls, mat = self.groups[dim]
+            scores = mat.scores(queries) if isinstance(mat, QuantizedMatrix) else queries @ mat.T
+            kk = min(k, len(rolls))
+            top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for row, i in enumerate(idxs):
+                results[i] = [(rolls[j], float(s)) for j, s in zip(top[row], top_scores[row])]
+        return results
+
+    def largest_group(self):
+        """(rolls, float32 matrix) for the most common embedding dimension"""
+        rolls, mat = max(self.groups.values(), key=lambda group: len(group[0]))
+        return rolls, mat.dequantize() if isinstance(mat, QuantizedMatrix) else mat
+
+    def match(self, embs, threshold=0.45):
+        """Best (roll, score) per query; roll is None when nothing beats threshold"""
+        matches = []
+        for hits in self.search(embs, k=1):
+            if hits and hits[0][1] > threshold:
+                matches.append(hits[0])
+            else:
+                matches.append((None, hits[0][1] if hits else 0.0))
+        return matches
+
+
+def match_faces(faces, gallery, threshold=0.45):
+    """[(bbox, roll, sim)] for InsightFace faces; roll is None when unknown"""
+    kept, embs = [], []
+    for f in faces:
+        emb = normalize(f.embedding)
+        if emb is None: continue
+        kept.append(f)
+        embs.append(emb)
+    # One matrix multiply scores every face against the whole gallery
+    return [(f.bbox.astype(int), roll, sim)
+            for f, (roll, sim) in zip(kept, gallery.match(embs, threshold))]
@@ -0,0 +1,206 @@
+import json
+import os
+import time
+import numpy as np
+from gallery import Gallery, iter_records, parse_user
+
+INDEX_FILE = "index.json"
+
+
+def gallery_path(db, path="gallery", legacy_path="users"):
+    """`path`, or `legacy_path` while some of its users have no gallery copy yet.
+
+    Both checks are shallow gets, i.e. key lists only.
+    """
+    if legacy_path:
+        have = set(db.reference(path).get(shallow=True) or {})
+        missing = set(db.reference(legacy_path).get(shallow=True) or {}) - have
+        if missing:
+            print(f"{len(missing)} users have no {path}/ entry yet, loading {legacy_path}/ "
+                  f"with attendance history (run migrate_gallery.py once to fix)")
+            return legacy_path
+    return path
+
+
+class FirebaseBackend:
+    """Reads gallery records through a firebase_admin.db-like module.
+
+    Pass `firebase_admin.db` on a kiosk, or a fake_db.FakeDB offline.
+    Records come from `gallery/`, the history-free copy registration writes
+    next to each `users/` record, falling back to `users/` until
+    migrate_gallery.py has run. A user deleted from `users/` is dropped even
+    if its copy remains; any other edit must update both nodes (or re-run
+    migrate_gallery.py). Incremental sync relies on registration
+    writing an `updated_at` server timestamp; add `".indexOn": ["updated_at"]`
+    to the `gallery` rules (and `users`, while falling back to it) so the
+    query runs on the server.
+    """
+
+    def __init__(self, db, path="gallery", legacy_path="users"):
+        self.db = db
+        self.requested = (path, legacy_path)
+        self._path = None
+
+    @property
+    def path(self):
+        # Resolved on first use, once the database is reachable
+        if self._path is None:
+            self._path = gallery_path(self.db, *self.requested)
+        return self._path
+
+    def fetch_all(self):
+        return self._live(dict(iter_records(self.db.reference(self.path).get())))
+
+    def fetch_changed(self, since):
+        try:
+            query = self.db.reference(self.path).order_by_child("updated_at").start_at(since)
+            return self._live(dict(iter_records(query.get())))
+        except Exception as e:
+            if self.path == self.requested[0]:
+                raise
+            # Legacy users/ without its index rule: the server rejects the query
+            print(f"Indexed query on {self.path}/ failed ({e}); reading it all")
+            return {roll: data for roll, data in self.fetch_all().items()
+                    if not isinstance(data.get("updated_at"), (int, float)) or data["updated_at"] >= since}
+
+    def fetch_rolls(self):
+        return set(self._live({str(k): True for k in (self.db.reference(self.path).get(shallow=True) or {})}))
+
+    def _live(self, records):
+        """Drop gallery copies whose users/ record was deleted (a shallow key read)"""
+        path, legacy_path = self.requested
+        if self.path != path or not legacy_path:
+            return records
+        users = {str(k) for k in (self.db.reference(legacy_path).get(shallow=True) or {})}
+        return {roll: data for roll, data in records.items() if roll in users}
+
+    def fetch_user(self, roll):
+        return self.db.reference(f"{self.path}/{roll}").get()
+
+
+class GalleryStore:
+    """Local gallery cache that loads in milliseconds and syncs incrementally.
+
+    Embeddings live in a memory-mapped `.npy` matrix and roll/name/year in
+    index.json next to it. sync() only downloads users whose `updated_at`
+    is newer than the last sync, plus a shallow key list to spot deletions
+    and legacy records written without `updated_at`.
+    """
+
+    def __init__(self, cache_dir, backend):
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.rolls = []
+        self.info = []      # {"name", "roll", "year", "updated_at"} per row
+        self.mat = np.zeros((0, 0), dtype=np.float32)
+        self.synced_at = None
+        self.matrix_file = None
+
+    def load(self):
+        """Load the cache from disk; False when there is none yet"""
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), encoding="utf-8") as fh:
+                index = json.load(fh)
+            mat = np.load(os.path.join(self.cache_dir, index["matrix"]), mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return False
+        self.rolls, self.info = index["rolls"], index["info"]
+        self.synced_at, self.matrix_file = index["synced_at"], index["matrix"]
+        self.mat = mat
+        return True
+
+    def sync(self):
+        """Apply remote changes since the last sync; returns how many rolls changed"""
+        if self.synced_at is None:
+            changed, removed = self.backend.fetch_all(), set(self.rolls)
+            removed -= set(changed)
+        else:
+            # start_at is inclusive: drop records we already hold at that stamp
+            seen = {roll: info.get("updated_at") for roll, info in zip(self.rolls, self.info)}
+            changed = {roll: data for roll, data in self.backend.fetch_changed(self.synced_at).items()
+                       if roll not in seen or seen[roll] != data.get("updated_at")}
+            remote = self.backend.fetch_rolls()
+            removed = set(self.rolls) - remote
+            known = set(self.rolls) | set(changed)
+            for roll in remote - known:
+                data = self.backend.fetch_user(roll)
+                if isinstance(data, dict):
+                    changed[roll] = data
+
+        stamps = [d["updated_at"] for d in changed.values() if isinstance(d.get("updated_at"), (int, float))]
+        synced_at = max(stamps + [self.synced_at or 0])
+        if not changed and not removed and synced_at == self.synced_at:
+            return 0
+        self._apply(changed, removed)
+        self.synced_at = synced_at
+        self._save()
+        return len(changed) + len(removed)
+
+    def users(self):
+        """Entries in the same shape as arcface_detect.load_users()"""
+        return {roll: dict(info, emb_norm=self.mat[i]) for i, (roll, info) in enumerate(zip(self.rolls, self.info))}
+
+    def gallery(self):
+        return Gallery.from_matrix(self.rolls, self.mat)
+
+    def _apply(self, changed, removed):
+        dim = self.mat.shape[1] if self.mat.size else None
+        pos = {roll: i for i, roll in enumerate(self.rolls)}
+        keep = np.ones(len(self.rolls), dtype=bool)
+        mat = np.array(self.mat, dtype=np.float32)
+        rolls, info = list(self.rolls), list(self.info)
+        new_rows = []
+
+        for roll in removed:
+            if roll in pos:
+                keep[pos[roll]] = False
+        for roll, data in changed.items():
+            try:
+                entry = parse_user(roll, data)
+            except Exception as e:
+                # One bad record must not stop the rest of the sync
+                print(f"Skipping user {roll}: {e}")
+                continue
+            emb = entry.pop("emb_norm")
+            entry["updated_at"] = data.get("updated_at")
+            if dim is None and emb.size:
+                dim = emb.size
+                mat = np.zeros((len(self.rolls), dim), dtype=np.float32)
+            if roll in pos:
+                # Embeddings of another size can never be compared - store a zero row
+                mat[pos[roll]] = emb if emb.size == dim else 0.0
+                info[pos[roll]] = entry
+            else:
+                rolls.append(roll)
+                info.append(entry)
+                new_rows.append(emb)
+
+        if new_rows and dim is None:
+            # No valid embedding anywhere yet: keep a (users x 0) matrix
+            mat = np.zeros((len(rolls), 0), dtype=np.float32)
+        elif new_rows:
+            # Only now is the width known for records seen before the first valid one
+            zero = np.zeros(dim, dtype=np.float32)
+            mat = np.vstack([mat.reshape(-1, dim)] +
+                            [(r if r.size == dim else zero).reshape(1, -1) for r in new_rows])
+        keep = np.concatenate([keep, np.ones(len(new_rows), dtype=bool)])
+        self.mat = np.ascontiguousarray(mat[keep], dtype=np.float32)
+        self.rolls = [r for r, k in zip(rolls, keep) if k]
+        self.info = [e for e, k in zip(info, keep) if k]
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # A new file per sync: the previous one may still be memory-mapped
+        old = self.matrix_file
+        self.matrix_file = f"embeddings-{time.time_ns()}.npy"
+        np.save(os.path.join(self.cache_dir, self.matrix_file), self.mat)
+        tmp = os.path.join(self.cache_dir, INDEX_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"synced_at": self.synced_at, "matrix": self.matrix_file,
+                       "rolls": self.rolls, "info": self.info}, fh)
+        os.replace(tmp, os.path.join(self.cache_dir, INDEX_FILE))
+        if old and old != self.matrix_file:
+            try:
+                os.remove(os.path.join(self.cache_dir, old))
+            except OSError:
+                pass
@@ -0,0 +1,355 @@
+"""Several entrance cameras in one process, with one model and one gallery.
+
+    python kiosk_server.py --source 0 --source 1 --source entrance_b.mp4 --display
+
+Each source (camera index or video file - files are paced to their FPS and
+looped, for testing) gets a capture thread feeding a latest-frame-wins
+queue. A single inference loop visits the streams round-robin, taking at
+most one new frame from each per round so a fast camera cannot starve a
+slow one. Faces from every frame in the round are aligned and embedded in
+one batched recognition call and scored against the gallery in one matmul.
+Recognitions are appended to --log as JSONL.
+
+With --credentials, each stream also marks attendance hands-free: a roll
+recognized in --mark-votes of a stream's last --mark-frames recognitions
+is marked once a day across all streams (and all kiosks, via the
+attendance_days index), through one journaled AttendanceWriter. The
+gallery is re-synced in the background every --sync-interval seconds.
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime
+import cv2
+from gallery import normalize
+from pipeline import LatestQueue
+from metrics import Metrics
+from face_models import create_face_analyser, embed_faces, AdaptiveDetector, CPU_PROFILE
+from batch_recognize import load_gallery
+from attendance_writer import AttendanceWriter
+from attendance_store import AttendanceStore
+from auto_mark import AutoMarker, today
+
+
+class Stream:
+    """One camera or video file, captured on its own thread"""
+
+    def __init__(self, index, source):
+        self.index = index
+        self.source = source
+        self.is_file = not str(source).isdigit()
+        self.cap = cv2.VideoCapture(source if self.is_file else int(source))
+        self.frames = LatestQueue()
+        self.results = LatestQueue()
+        self.seen = 0           # last frame sequence number processed
+        self.processed = 0
+        self.detector = None
+        self.marker = None      # AutoMarker when marking attendance
+        self.last_logged = {}   # roll -> time it was last written to the log
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._capture, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self.cap.release()
+
+    def _capture(self):
+        delay = 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 25.0) if self.is_file else 0
+        while not self._stop.is_set():
+            ok, frame = self.cap.read()
+            if not ok:
+                if self.is_file:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                else:
+                    time.sleep(0.01)
+                continue
+            self.frames.put(frame)
+            if delay:
+                time.sleep(delay)
+
+
+class KioskServer:
+    def __init__(self, streams, analyser, store, threshold=0.45, max_batch=32,
+                 log_path=None, log_gap=30.0, metrics=None, adaptive=True, min_face=80, full_every=10,
+                 db=None, writer=None, attendance=None, auto_mark=(5, 4, 1.0), sync_interval=60.0,
+                 day_retry=10.0, day_refresh=300.0):
+        self.streams = streams
+        self.analyser = analyser
+        self.store = store
+        self.gallery = store.gallery()
+        self.info = dict(zip(store.rolls, store.info))
+        self.db = db
+        self.writer = writer            # None: recognitions are only logged
+        self.attendance = attendance
+        self.sync_interval = sync_interval
+        self.day_retry = day_retry
+        self.day_refresh = day_refresh
+        self.seeded_day = None          # day whose attendance_days index has been read
+        self.closing = threading.Event()
+        self.threshold = threshold
+        self.max_batch = max_batch
+        self.log = open(log_path, "a", encoding="utf-8") if log_path else None
+        self.log_gap = log_gap
+        self.metrics = metrics or Metrics()
+        self.rounds = 0
+        self.faces_done = 0
+        self.batches = 0
+        for s in streams:
+            # Detector state (previous faces) is per stream; None scans every
+            # full frame at the analyser's det_size
+            s.detector = AdaptiveDetector(analyser.det_model, full_every, min_face=min_face) if adaptive else None
+            if writer is not None:
+                # Votes are counted per entrance; marks are shared through self.mark
+                s.marker = AutoMarker(self.mark, *auto_mark)
+        if writer is not None:
+            self.seed([e["roll"] for e in writer.pending_marks() if e["ts"].startswith(today())], today())
+            if attendance:
+                # Marks already acknowledged have left the journal but not the local store
+                self.seed([row[0] for row in attendance.present(today())], today())
+
+    def seed(self, rolls, day=None):
+        """Add rolls already marked on `day` to every stream's dedup index"""
+        for s in self.streams:
+            s.marker.seed(rolls, day)
+
+    def mark(self, roll):
+        ts = self.writer.mark(roll)
+        # The other entrances must not mark the same roll again today
+        self.seed([roll])
+        print(f"Marked {roll} ({self.info[roll]['name']}) at {ts}")
+        return ts
+
+    def seed_marked(self):
+        """Add rolls any kiosk marked today (attendance_days index) to the dedup index"""
+        day = today()
+        try:
+            with self.metrics.time("firebase_day_index"):
+                marks = self.db.reference(f"attendance_days/{day}").get(shallow=True) or {}
+            self.seed(marks, day)
+            if self.attendance:
+                self.attendance.import_day(day, marks)
+        except Exception as e:
+            print(f"Could not load today's attendance: {e}")
+            return False
+        self.seeded_day = day
+        return True
+
+    def seed_days(self):
+        """Background thread: read the day's index, retrying every day_retry
+        seconds until it succeeds and refreshing it every day_refresh"""
+        last_read = 0.0
+        while True:
+            if self.seeded_day != today() or time.monotonic() - last_read >= self.day_refresh:
+                if self.seed_marked():
+                    last_read = time.monotonic()
+            if self.closing.wait(self.day_retry):
+                return
+
+    def sync_gallery(self):
+        """Background thread: pull gallery changes every sync_interval and swap them in"""
+        while not self.closing.wait(self.sync_interval):
+            try:
+                with self.metrics.time("firebase_sync"):
+                    changed = self.store.sync()
+                if changed:
+                    # Entries of removed users stay so in-flight results still resolve
+                    self.info = dict(self.info, **dict(zip(self.store.rolls, self.store.info)))
+                    if self.attendance:
+                        self.attendance.upsert_students(self.info)
+                    self.gallery = self.store.gallery()
+                    print(f"Gallery synced: {changed} changed, {len(self.store.rolls)} users")
+            except Exception as e:
+                print(f"Gallery sync error: {e}")
+
+    def start(self):
+        """Start background gallery sync and, when marking, the day index reads"""
+        if self.store.backend is not None:
+            threading.Thread(target=self.sync_gallery, daemon=True).start()
+        if self.writer is not None:
+            threading.Thread(target=self.seed_days, daemon=True).start()
+        return self
+
+    def step(self):
+        """One scheduling round; False when no stream had a new frame"""
+        # Rotate the starting stream so no stream is always served first
+        k = self.rounds % len(self.streams)
+        order = self.streams[k:] + self.streams[:k]
+        self.rounds += 1
+
+        batch = []
+        for s in order:
+            seq, frame = s.frames.peek()
+            if seq != s.seen and frame is not None:
+                s.seen = seq
+                batch.append((s, frame))
+        if not batch:
+            return False
+
+        faces = []  # (stream, frame, bbox, kps)
+        with self.metrics.time("detect"):
+            for s, frame in batch:
+                if s.detector is not None:
+                    bboxes, kpss = s.detector.detect(frame)
+                else:
+                    bboxes, kpss = self.analyser.det_model.detect(frame, max_num=0, metric='default')
+                if kpss is None:
+                    continue
+                faces += [(s, frame, b[:4].astype(int), kps) for b, kps in zip(bboxes, kpss)]
+
+        embs = embed_faces(self.analyser, [(f, kps) for _, f, _, kps in faces],
+                           self.metrics, self.max_batch)
+        unit = [normalize(e) for e in embs]
+        gallery, info = self.gallery, self.info  # a sync may swap them mid-round
+        with self.metrics.time("match"):
+            # A degenerate (zero) embedding is scored as a zero vector: never a match
+            matches = gallery.match([u if u is not None else e * 0 for u, e in zip(unit, embs)],
+                                         self.threshold)
+
+        per_stream = {s.index: [] for s, _ in batch}
+        for (s, _, bbox, _), (roll, sim) in zip(faces, matches):
+            per_stream[s.index].append((bbox, roll, sim))
+        marking = self.writer is not None and self.seeded_day == today()
+        for s, frame in batch:
+            s.results.put((frame, per_stream[s.index]))
+            s.processed += 1
+            self._log(s, per_stream[s.index], info)
+            if marking:
+                s.marker.update(per_stream[s.index])
+        self.faces_done += len(faces)
+        self.batches += 1 if faces else 0
+        return True
+
+    def _log(self, stream, matches, info):
+        if not self.log:
+            return
+        now = time.time()
+        for bbox, roll, sim in matches:
+            if roll and now - stream.last_logged.get(roll, 0) >= self.log_gap:
+                stream.last_logged[roll] = now
+                self.log.write(json.dumps({
+                    "stream": stream.index, "source": str(stream.source),
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "roll": roll, "name": info[roll]["name"],
+                    "score": round(sim, 4), "bbox": bbox.tolist()}) + "\n")
+                self.log.flush()
+
+    def run(self, display=False, report_every=10.0):
+        last_report, last_counts = time.monotonic(), [0] * len(self.streams)
+        last_faces, last_batches = 0, 0
+        try:
+            while True:
+                if not self.step():
+                    time.sleep(0.002)
+                if display:
+                    self.show()
+                    if cv2.waitKey(1) & 0xFF == ord("q"):
+                        break
+                now = time.monotonic()
+                if now - last_report >= report_every:
+                    span = now - last_report
+                    counts = [s.processed for s in self.streams]
+                    fps = ", ".join(f"{s.source}={(c - p) / span:.1f}"
+                                    for s, c, p in zip(self.streams, counts, last_counts))
+                    faces, batches = self.faces_done - last_faces, self.batches - last_batches
+                    print(f"fps per stream: {fps} | faces/s {faces / span:.1f}, "
+                          f"{faces / max(batches, 1):.1f} faces per recognition batch")
+                    last_report, last_counts = now, counts
+                    last_faces, last_batches = self.faces_done, self.batches
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.closing.set()
+            if self.writer is not None:
+                self.writer.stop()
+            if self.log:
+                self.log.close()
+
+    def show(self):
+        info = self.info
+        for s in self.streams:
+            _, result = s.results.peek()
+            if result is None:
+                continue
+            frame, matches = result
+            frame = frame.copy()
+            for (x1, y1, x2, y2), roll, _ in matches:
+                clr = (0, 255, 0) if roll else (0, 0, 255)
+                cv2.rectangle(frame, (x1, y1), (x2, y2), clr, 2)
+                cv2.putText(frame, info[roll]["name"] if roll else "Unknown",
+                            (x1, y1 - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.6, clr, 2)
+            cv2.imshow(f"Stream {s.index}: {s.source}", frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", action="append", required=True,
+                        help="camera index or video file; repeat for each stream")
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--det-size", type=int, default=640,
+                        help="detector input size with --no-adaptive (adaptive mode sizes from --min-face)")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="scan every full frame at --det-size instead of around the last faces")
+    parser.add_argument("--min-face", type=int, default=80,
+                        help="smallest face (px) an adaptive full scan must find; lower for CCTV")
+    parser.add_argument("--full-every", type=int, default=10, help="adaptive: full scan every N detections")
+    parser.add_argument("--max-batch", type=int, default=32, help="faces per recognition call")
+    parser.add_argument("--log", default="recognitions.jsonl")
+    parser.add_argument("--log-gap", type=float, default=30.0,
+                        help="seconds before the same roll is logged again on a stream")
+    parser.add_argument("--display", action="store_true")
+    parser.add_argument("--cpu", action="store_true", help="CPU-only with face_models.CPU_PROFILE")
+    parser.add_argument("--threads", type=int, help="intra-op threads per model (implies --cpu)")
+    parser.add_argument("--rec-model", help="e.g. an int8 ArcFace from quantize_recognition.py (implies --cpu)")
+    parser.add_argument("--gallery", default="gallery_cache")
+    parser.add_argument("--credentials", help="service account JSON: sync the gallery and mark attendance")
+    parser.add_argument("--database-url")
+    parser.add_argument("--sync-interval", type=float, default=60.0, help="seconds between gallery syncs")
+    parser.add_argument("--no-mark", action="store_true", help="only log recognitions, even with --credentials")
+    parser.add_argument("--journal", default="attendance_journal_kiosk.jsonl",
+                        help="marks not yet written to Firebase; one per process")
+    parser.add_argument("--attendance-db", help="local SQLite copy of attendance for attendance_report.py")
+    parser.add_argument("--mark-frames", type=int, default=5, help="recognitions per stream a mark votes over")
+    parser.add_argument("--mark-votes", type=int, default=4, help="of --mark-frames needed to mark")
+    parser.add_argument("--mark-cooldown", type=float, default=1.0,
+                        help="seconds a stream marks nobody after a mark")
+    args = parser.parse_args()
+
+    store = load_gallery(args)
+    db = writer = attendance = None
+    if args.credentials:
+        from firebase_admin import db  # initialized by load_gallery
+        if not args.no_mark:
+            attendance = AttendanceStore(args.attendance_db) if args.attendance_db else None
+            if attendance:
+                attendance.upsert_students(dict(zip(store.rolls, store.info)))
+            writer = AttendanceWriter(db, args.journal,
+                                      on_mark=attendance.add_mark if attendance else None)
+    profile = None
+    if args.cpu or args.threads is not None or args.rec_model:
+        profile = dict(CPU_PROFILE, recognition_model=args.rec_model or CPU_PROFILE["recognition_model"])
+        if args.threads is not None:
+            profile["intra_op_threads"] = args.threads
+    analyser = create_face_analyser(det_size=(args.det_size, args.det_size), profile=profile)
+    streams = [Stream(i, src).start() for i, src in enumerate(args.source)]
+    server = KioskServer(streams, analyser, store, args.threshold, args.max_batch,
+                         args.log, args.log_gap, adaptive=not args.no_adaptive,
+                         min_face=args.min_face, full_every=args.full_every,
+                         db=db, writer=writer, attendance=attendance,
+                         auto_mark=(args.mark_frames, args.mark_votes, args.mark_cooldown),
+                         sync_interval=args.sync_interval).start()
+    try:
+        server.run(display=args.display)
+    finally:
+        for s in streams:
+            s.stop()
+        cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
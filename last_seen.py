@@ -0,0 +1,82 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+class LastSeen:
+    """Per-user "last attendance" looked up on demand, not at gallery load.
+
+    get() answers from a small LRU cache and otherwise returns None and
+    queues a background read of `users/{roll}/last_seen` (one string), so
+    the Tk thread never waits on the database. Records written before
+    last_seen existed fall back to the newest entry of attendance_history.
+    set() records this kiosk's own marks without a read. A failed read is
+    not retried for `retry` seconds, so an offline kiosk does not issue one
+    per recognition.
+    """
+
+    def __init__(self, db, size=256, path="users", ready=None, retry=30.0):
+        self.db = db
+        self.size = size
+        self.path = path
+        self.ready = ready      # anything with wait(), e.g. a Deferred database client
+        self.retry = retry
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._failed = {}       # roll -> time.monotonic() before which it is not re-read
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def get(self, roll):
+        """Cached value ("" for never marked), or None while it is being fetched"""
+        with self._lock:
+            if roll in self._cache:
+                self._cache.move_to_end(roll)
+                return self._cache[roll]
+            if roll not in self._queued and time.monotonic() >= self._failed.get(roll, 0.0):
+                self._queued.add(roll)
+                self._queue.put(roll)
+        return None
+
+    def set(self, roll, ts):
+        with self._lock:
+            if ts >= (self._cache.get(roll) or ""):
+                self._put(roll, ts)
+
+    def _put(self, roll, value):
+        self._cache[roll] = value
+        self._cache.move_to_end(roll)
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+
+    def fetch(self, roll):
+        value = self.db.reference(f"{self.path}/{roll}/last_seen").get()
+        if not value:
+            hist = self.db.reference(f"{self.path}/{roll}/attendance_history") \
+                .order_by_key().limit_to_last(1).get()
+            # A single remaining key "0" comes back as a JSON array, i.e. a list
+            entries = hist if isinstance(hist, list) else list((hist or {}).values())
+            value = next((v for v in reversed(entries) if v is not None), "")
+        return value if isinstance(value, str) else ""
+
+    def _run(self):
+        if self.ready is not None:
+            self.ready.wait()
+        while True:
+            roll = self._queue.get()
+            try:
+                value = self.fetch(roll)
+            except Exception as e:
+                print(f"Last seen lookup failed for {roll}: {e}")
+                value = None
+            with self._lock:
+                self._queued.discard(roll)
+                if value is None:
+                    self._failed[roll] = time.monotonic() + self.retry
+                else:
+                    self._failed.pop(roll, None)
+                    # A mark set() while the read was in flight is newer
+                    if value >= (self._cache.get(roll) or ""):
+                        self._put(roll, value)
@@ -0,0 +1,139 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import cv2
+import numpy as np
+
+# Prometheus histogram bucket bounds, in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class Stage:
+    """Rolling window of recent durations plus cumulative histogram counts"""
+
+    def __init__(self, window):
+        self.recent = deque(maxlen=window)  # (end time, seconds)
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.recent.append((time.monotonic(), seconds))
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def rate(self):
+        """Events per second over the rolling window"""
+        if len(self.recent) < 2:
+            return 0.0
+        span = self.recent[-1][0] - self.recent[0][0]
+        return (len(self.recent) - 1) / span if span > 0 else 0.0
+
+
+class Metrics:
+    """Per-stage timing for the hot path.
+
+    Wrap a stage in `with metrics.time("detect"):` (or call record()).
+    Keeps a rolling window per stage for percentiles and FPS, cumulative
+    histograms for Prometheus, can draw an on-frame overlay and export
+    periodically to a Prometheus textfile (.prom) or JSON file.
+    A disabled instance costs next to nothing, so callers never branch.
+    """
+
+    def __init__(self, window=300, enabled=True, labels=None):
+        self.window = window
+        self.enabled = enabled
+        self.labels = {"kiosk": socket.gethostname(), **(labels or {})}
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._export_stop = threading.Event()
+
+    @contextmanager
+    def time(self, stage):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = Stage(self.window)
+            self.stages[stage].add(seconds)
+
+    def summary(self):
+        out = {}
+        with self._lock:
+            for name, st in self.stages.items():
+                ms = np.array([s for _, s in st.recent]) * 1000
+                out[name] = {
+                    "count": st.count,
+                    "rate": round(st.rate(), 2),
+                    "p50_ms": round(float(np.percentile(ms, 50)), 3) if len(ms) else 0.0,
+                    "p90_ms": round(float(np.percentile(ms, 90)), 3) if len(ms) else 0.0,
+                    "p99_ms": round(float(np.percentile(ms, 99)), 3) if len(ms) else 0.0,
+                    "mean_ms": round(float(ms.mean()), 3) if len(ms) else 0.0,
+                }
+        return out
+
+    def overlay(self, frame, fps_stages=("camera_read", "inference", "display")):
+        """Draw FPS and p50 latency per stage in the frame's top-right corner"""
+        summary = self.summary()
+        lines = [f"{name} {summary[name]['rate']:.1f} fps" for name in fps_stages if name in summary]
+        lines += [f"{name} {s['p50_ms']:.1f} ms" for name, s in sorted(summary.items())]
+        x = frame.shape[1] - 230
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (x, 20 + 16 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 0), 1)
+
+    def prometheus(self):
+        labels = ",".join(f'{k}="{v}"' for k, v in self.labels.items())
+        lines = ["# TYPE attendance_stage_seconds histogram"]
+        with self._lock:
+            for name, st in sorted(self.stages.items()):
+                lbl = f'{labels},stage="{name}"'
+                for bound, n in zip(BUCKETS, st.buckets):
+                    lines.append(f'attendance_stage_seconds_bucket{{{lbl},le="{bound}"}} {n}')
+                lines.append(f'attendance_stage_seconds_bucket{{{lbl},le="+Inf"}} {st.count}')
+                lines.append(f"attendance_stage_seconds_sum{{{lbl}}} {st.total:.6f}")
+                lines.append(f"attendance_stage_seconds_count{{{lbl}}} {st.count}")
+        lines.append("# TYPE attendance_stage_rate gauge")
+        for name, s in sorted(self.summary().items()):
+            lines.append(f'attendance_stage_rate{{{labels},stage="{name}"}} {s["rate"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write a .prom textfile (node_exporter collector) or JSON, atomically"""
+        if path.endswith(".json"):
+            body = json.dumps({"time": time.time(), "labels": self.labels, "stages": self.summary()})
+        else:
+            body = self.prometheus()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(body)
+        os.replace(tmp, path)
+
+    def start_export(self, path, interval=15.0):
+        def loop():
+            while not self._export_stop.wait(interval):
+                try:
+                    self.export(path)
+                except OSError as e:
+                    print(f"Metrics export failed: {e}")
+        if self.enabled and path:
+            threading.Thread(target=loop, daemon=True).start()
+
+    def stop_export(self):
+        self._export_stop.set()
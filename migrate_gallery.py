@@ -0,0 +1,86 @@
+"""Copy existing users into the history-free gallery/ node, once per database.
+
+    python migrate_gallery.py --credentials key.json \
+        --database-url https://YOUR-PROJECT-ID-default-rtdb.firebaseio.com/
+
+Registration writes gallery/{roll} next to users/{roll}; users registered
+before that only exist under users/, so kiosks keep loading users/ (with
+every attendance history) until this has run. users/ is read in pages of
+--page-size records and copied in batched multi-path updates. Copies that
+already match are left alone; new copies without `updated_at`, and copies
+that differ from their user (e.g. a name edited only under users/), get a
+server timestamp so incremental sync picks them up. gallery/ entries whose
+user is gone are removed. Safe to re-run after any edit to users/.
+"""
+import argparse
+import time
+from gallery import GALLERY_FIELDS, iter_records
+
+
+def gallery_updates(page, existing):
+    """Writes for the users in `page` whose gallery copy is missing or differs"""
+    updates = {}
+    for roll, data in page.items():
+        if not isinstance(data, dict) or not data.get("embedding"):
+            continue
+        entry = {k: data[k] for k in GALLERY_FIELDS if k in data}
+        entry.setdefault("roll", roll)
+        old = existing.get(roll)
+        if old is not None:
+            fields = [k for k in GALLERY_FIELDS if k != "updated_at"]
+            if all(old.get(k) == entry.get(k) for k in fields):
+                continue
+            # Kiosks only re-read records whose updated_at moved
+            entry["updated_at"] = {".sv": "timestamp"}
+        entry.setdefault("updated_at", {".sv": "timestamp"})
+        updates[f"gallery/{roll}"] = entry
+    return updates
+
+
+def migrate(db, page_size=200, dry_run=False):
+    """Returns (users copied, gallery entries removed)"""
+    # The current copies carry no history, so reading them all is cheap
+    existing = dict(iter_records(db.reference("gallery").get()))
+    copied, start_key = 0, None
+    while True:
+        query = db.reference("users").order_by_key()
+        if start_key is not None:
+            query = query.start_at(start_key)
+        page = dict(iter_records(query.limit_to_first(page_size + (start_key is not None)).get()))
+        # start_at is inclusive: the previous page's last key comes back first
+        page.pop(start_key, None)
+        if not page:
+            break
+        updates = gallery_updates(page, existing)
+        if updates and not dry_run:
+            db.reference("/").update(updates)
+        copied += len(updates)
+        start_key = list(page)[-1]  # in the server's key order
+        print(f"{copied} users copied (up to roll {start_key})")
+
+    users = set(db.reference("users").get(shallow=True) or {})
+    stale = set(db.reference("gallery").get(shallow=True) or {}) - users
+    if stale and not dry_run:
+        db.reference("/").update({f"gallery/{roll}": None for roll in stale})
+    return copied, len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--credentials", required=True, help="service account JSON")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--page-size", type=int, default=200, help="users read per request")
+    parser.add_argument("--dry-run", action="store_true", help="read and count, write nothing")
+    args = parser.parse_args()
+
+    import firebase_admin
+    from firebase_admin import credentials, db
+    firebase_admin.initialize_app(credentials.Certificate(args.credentials),
+                                  {"databaseURL": args.database_url})
+    start = time.perf_counter()
+    copied, removed = migrate(db, args.page_size, args.dry_run)
+    print(f"Done in {time.perf_counter() - start:.1f}s: {copied} copied, {removed} stale removed")
+
+
+if __name__ == "__main__":
+    main()
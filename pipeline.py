@@ -0,0 +1,90 @@
+import threading
+import time
+from metrics import Metrics
+
+
+class LatestQueue:
+    """Single-slot queue where the newest item wins.
+
+    put() overwrites whatever has not been consumed yet, so a slow consumer
+    never works through a backlog of stale frames. Every item carries a
+    sequence number so readers can tell whether it is new to them.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._seq = 0
+
+    def put(self, item):
+        with self._cond:
+            self._item = item
+            self._seq += 1
+            self._cond.notify_all()
+
+    def get(self, after=0, timeout=None):
+        """Wait for an item newer than sequence `after`; (seq, None) on timeout"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after, timeout)
+            if self._seq > after:
+                return self._seq, self._item
+            return after, None
+
+    def peek(self):
+        with self._cond:
+            return self._seq, self._item
+
+
+class FramePipeline:
+    """Capture -> inference stages on worker threads, read by the Tk thread.
+
+    The capture thread keeps draining the camera at its own FPS and the
+    inference thread always picks up the newest frame, so a slow model only
+    lowers the recognition rate - never the preview rate. The GUI polls
+    `frames` for display and `results` for the latest completed inference.
+    `infer(frame)` must not touch Tk widgets.
+    """
+
+    def __init__(self, cap, infer, metrics=None):
+        self.cap = cap
+        self.infer = infer
+        self.metrics = metrics or Metrics(enabled=False)
+        self.frames = LatestQueue()
+        self.results = LatestQueue()
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._capture, daemon=True),
+                         threading.Thread(target=self._inference, daemon=True)]
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            if t.is_alive():
+                t.join(timeout=1.0)
+
+    def _capture(self):
+        while not self._stop.is_set():
+            with self.metrics.time("camera_read"):
+                ok, frame = self.cap.read()
+            if ok:
+                self.frames.put(frame)
+            else:
+                time.sleep(0.01)
+
+    def _inference(self):
+        seq = 0
+        while not self._stop.is_set():
+            seq, frame = self.frames.get(seq, timeout=0.1)
+            if frame is None:
+                continue
+            try:
+                with self.metrics.time("inference"):
+                    result = self.infer(frame)
+            except Exception as e:
+                print(f"Inference error: {e}")
+                continue
+            self.results.put(result)
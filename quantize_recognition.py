@@ -0,0 +1,98 @@
+"""Write an int8 copy of the buffalo_l ArcFace model for CPU kiosks.
+
+    python quantize_recognition.py                          # dynamic: weights only
+    python quantize_recognition.py --calibrate photos/      # static, calibrated on your faces
+
+Dynamic quantization stores int8 weights and quantizes activations on the
+fly; static quantization also fixes activation ranges from aligned faces
+found in --calibrate (images or folders of them), which usually runs
+faster on CPU. Either way, check speed and cosine drift against the fp32
+model with bench_inference.py before setting it as `recognition_model` in
+face_models.CPU_PROFILE.
+"""
+import argparse
+import os
+import cv2
+from batch_recognize import IMAGE_EXTS
+from face_models import create_face_analyser
+
+
+def image_paths(sources):
+    for src in sources:
+        if os.path.isdir(src):
+            for root, _, names in os.walk(src):
+                for name in sorted(names):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTS:
+                        yield os.path.join(root, name)
+        else:
+            yield src
+
+
+def face_crops(app, sources, limit):
+    """Aligned recognition-size crops of the largest face in each image"""
+    from insightface.utils import face_align
+    size = app.models["recognition"].input_size[0]
+    crops = []
+    for path in image_paths(sources):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        bboxes, kpss = app.det_model.detect(img, max_num=1, metric='default')
+        if len(bboxes) and kpss is not None:
+            crops.append(face_align.norm_crop(img, landmark=kpss[0], image_size=size))
+        if len(crops) >= limit:
+            break
+    return crops
+
+
+class CropReader:
+    """onnxruntime CalibrationDataReader over preprocessed face crops"""
+
+    def __init__(self, rec, crops, batch=16):
+        self.input_name = rec.input_name
+        blob = cv2.dnn.blobFromImages(crops, 1.0 / rec.input_std, rec.input_size,
+                                      (rec.input_mean,) * 3, swapRB=True)
+        self.batches = iter([blob[i:i + batch] for i in range(0, len(blob), batch)])
+
+    def get_next(self):
+        blob = next(self.batches, None)
+        return None if blob is None else {self.input_name: blob}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", help="default: <model>_int8.onnx next to the fp32 model")
+    parser.add_argument("--calibrate", nargs="+", help="face photos/folders for static quantization")
+    parser.add_argument("--max-faces", type=int, default=500, help="calibration faces to use")
+    parser.add_argument("--per-channel", action="store_true", help="per-channel weight scales")
+    args = parser.parse_args()
+
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    app = create_face_analyser()
+    rec = app.models["recognition"]
+    src = rec.model_file
+    out = args.out or os.path.splitext(src)[0] + ("_int8_static" if args.calibrate else "_int8") + ".onnx"
+
+    # Shape inference and graph cleanup first, as onnxruntime recommends
+    prepped = os.path.splitext(out)[0] + ".prep.onnx"
+    quant_pre_process(src, prepped)
+    try:
+        if args.calibrate:
+            crops = face_crops(app, args.calibrate, args.max_faces)
+            if not crops:
+                raise SystemExit("No faces found for calibration")
+            print(f"Calibrating on {len(crops)} faces")
+            quantize_static(prepped, out, CropReader(rec, crops), quant_format=QuantFormat.QDQ,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                            per_channel=args.per_channel)
+        else:
+            quantize_dynamic(prepped, out, weight_type=QuantType.QInt8, per_channel=args.per_channel)
+    finally:
+        os.remove(prepped)
+    print(f"{src} ({os.path.getsize(src) / 1e6:.1f} MB) -> {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
+    print(f'Try it: python bench_inference.py photos/ --rec-model "{out}"')
+
+
+if __name__ == "__main__":
+    main()
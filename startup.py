@@ -0,0 +1,57 @@
+import threading
+import time
+
+# Taken when the first app module imports this one - close enough to process start
+PROCESS_START = time.perf_counter()
+
+
+def since_start():
+    return time.perf_counter() - PROCESS_START
+
+
+class Deferred:
+    """Build something expensive on a background thread.
+
+    start() kicks off `factory` so models or clients load while the window
+    comes up; get() waits for the value (re-raising a factory error) and
+    ready()/wait() let callers poll instead of blocking.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.seconds = None  # how long the factory took
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self._value = self.factory()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            self._done.set()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        self.start()
+        return self._done.wait(timeout)
+
+    def get(self):
+        self.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
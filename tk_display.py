@@ -0,0 +1,74 @@
+import time
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+from metrics import Metrics
+
+
+class FrameView:
+    """Shows BGR frames in a Tk label without per-frame allocations.
+
+    The label size is cached from <Configure> events instead of being
+    queried (with update_idletasks) every frame. Resize and RGB buffers are
+    allocated once per output size, and one PhotoImage is pasted into in
+    place. Frames arriving faster than `max_fps` are skipped - check due()
+    before drawing on a frame to skip that work too.
+    """
+
+    def __init__(self, label, metrics=None, max_fps=30, fallback=(640, 480)):
+        self.label = label
+        self.metrics = metrics or Metrics(enabled=False)
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.fallback = fallback
+        self.size = None         # (width, height) available in the label
+        self.key = None          # (frame shape, output size) the buffers are for
+        self.resized = self.rgb = self.image = self.photo = None
+        self.canvas = None       # reusable copy of the frame to draw on
+        self.last = 0.0
+        # Border and highlight would otherwise make the label grow with its image
+        self.inset = 2 * (int(label.cget("borderwidth")) + int(label.cget("highlightthickness")))
+        label.bind("<Configure>", self._configure, add="+")
+
+    def _configure(self, event):
+        self.size = (event.width - self.inset, event.height - self.inset)
+
+    def due(self):
+        return time.monotonic() - self.last >= self.interval
+
+    def scratch(self, frame):
+        """A copy of `frame` in a reused buffer, for drawing boxes and text"""
+        if self.canvas is None or self.canvas.shape != frame.shape:
+            self.canvas = np.empty_like(frame)
+        np.copyto(self.canvas, frame)
+        return self.canvas
+
+    def show(self, frame):
+        cpu = time.thread_time()
+        self.last = time.monotonic()
+        with self.metrics.time("display"):
+            h, w = frame.shape[:2]
+            if self.size and self.size[0] > 1 and self.size[1] > 1:
+                scale = min(self.size[0] / w, self.size[1] / h)
+                out = (max(1, int(w * scale)), max(1, int(h * scale)))
+            else:
+                out = self.fallback
+            if (frame.shape, out) != self.key:
+                self._allocate(frame.shape, out)
+            with self.metrics.time("display_resize"):
+                cv2.resize(frame, out, dst=self.resized)
+            with self.metrics.time("display_cvtcolor"):
+                cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=self.rgb)
+            with self.metrics.time("display_photoimage"):
+                self.photo.paste(self.image)
+        self.metrics.record("display_cpu", time.thread_time() - cpu)
+
+    def _allocate(self, shape, out):
+        w, h = out
+        self.resized = np.empty((h, w, 3), dtype=np.uint8)
+        self.rgb = np.empty((h, w, 3), dtype=np.uint8)
+        # A PIL view of the RGB buffer (no copy) and the one Tk image it is pasted into
+        self.image = Image.frombuffer("RGB", (w, h), self.rgb, "raw", "RGB", 0, 1)
+        self.photo = ImageTk.PhotoImage("RGB", (w, h))
+        self.label.configure(image=self.photo)
+        self.label.imgtk = self.photo
+        self.key = (shape, out)
@@ -0,0 +1,131 @@
+from collections import Counter, deque
+from itertools import count
+import cv2
+import numpy as np
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """One face followed across frames, with a rolling identity vote"""
+
+    def __init__(self, track_id, bbox, vote_window):
+        self.id = track_id
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.votes = deque(maxlen=vote_window)
+        self.points = None
+
+    def vote(self, roll, sim):
+        self.votes.append((roll, sim))
+
+    def identity(self):
+        """(roll, mean score) of the vote winner; roll is None for Unknown"""
+        tally = Counter(roll for roll, _ in self.votes)
+        top = max(tally.values())
+        # Ties go to the most recent vote
+        roll = next(r for r, _ in reversed(self.votes) if tally[r] == top)
+        return roll, float(np.mean([s for r, s in self.votes if r == roll]))
+
+
+class FaceTracker:
+    """Detect-every-N-frames tracking.
+
+    Full detection + embedding (`detect(frame)` -> [(bbox, roll, sim)]) runs
+    every `detect_every` frames, or as soon as a track is lost. In between,
+    boxes are moved by the median Lucas-Kanade optical flow of corner points
+    inside them. Detections are matched to tracks by IoU, so each track keeps
+    its identity and votes over the last `vote_window` recognitions.
+    """
+
+    MIN_POINTS = 5
+
+    def __init__(self, detect_every=5, iou_threshold=0.3, vote_window=7):
+        self.detect_every = detect_every
+        self.iou_threshold = iou_threshold
+        self.vote_window = vote_window
+        self.tracks = []
+        self.prev_gray = None
+        self.since_detect = 0
+        self.force_detect = True
+        self._ids = count(1)
+
+    def update(self, frame, detect):
+        """[(bbox, roll, sim)] for this frame, in the same form as `detect`"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.force_detect or self.since_detect + 1 >= self.detect_every:
+            self._associate(detect(frame))
+            self.since_detect = 0
+            self.force_detect = False
+        else:
+            self._propagate(gray)
+            self.since_detect += 1
+        for t in self.tracks:
+            if t.points is None:
+                t.points = self._corners(gray, t.bbox)
+        self.prev_gray = gray
+
+        out = []
+        for t in self.tracks:
+            roll, sim = t.identity()
+            out.append((t.bbox.astype(int), roll, sim))
+        return out
+
+    def _associate(self, detections):
+        pairs = sorted(((iou(t.bbox, d[0]), ti, di)
+                        for ti, t in enumerate(self.tracks)
+                        for di, d in enumerate(detections)), reverse=True)
+        used_t, used_d, kept = set(), set(), []
+        for overlap, ti, di in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if ti in used_t or di in used_d:
+                continue
+            used_t.add(ti)
+            used_d.add(di)
+            kept.append((self.tracks[ti], detections[di]))
+        for di, d in enumerate(detections):
+            if di not in used_d:
+                kept.append((Track(next(self._ids), d[0], self.vote_window), d))
+
+        # Tracks without a detection are dropped; the rest take the new box
+        self.tracks = []
+        for track, (bbox, roll, sim) in kept:
+            track.bbox = np.asarray(bbox, dtype=np.float32)
+            track.points = None
+            track.vote(roll, sim)
+            self.tracks.append(track)
+
+    def _propagate(self, gray):
+        alive = []
+        for t in self.tracks:
+            if t.points is None or len(t.points) < self.MIN_POINTS:
+                self.force_detect = True
+                continue
+            nxt, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, t.points, None)
+            good = status.ravel() == 1
+            if good.sum() < self.MIN_POINTS:
+                self.force_detect = True
+                continue
+            shift = np.median(nxt[good] - t.points[good], axis=0).ravel()
+            t.bbox = t.bbox + np.array([shift[0], shift[1], shift[0], shift[1]], dtype=np.float32)
+            t.points = nxt[good].reshape(-1, 1, 2)
+            alive.append(t)
+        self.tracks = alive
+
+    @staticmethod
+    def _corners(gray, bbox):
+        h, w = gray.shape[:2]
+        x1, y1 = max(0, int(bbox[0])), max(0, int(bbox[1]))
+        x2, y2 = min(w, int(bbox[2])), min(h, int(bbox[3]))
+        if x2 <= x1 or y2 <= y1:
+            return None
+        mask = np.zeros_like(gray)
+        mask[y1:y2, x1:x2] = 255
+        return cv2.goodFeaturesToTrack(gray, maxCorners=30, qualityLevel=0.01,
+                                       minDistance=5, mask=mask)